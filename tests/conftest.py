@@ -33,6 +33,18 @@ assert any(app in INSTALLED_APPS for app in ['posts.apps.PostsConfig', 'posts'])
     'Пожалуйста зарегистрируйте приложение в `settings.INSTALLED_APPS`'
 )
 
+import pytest
+
+from core.testing import separate_cache
+
+
+@pytest.fixture(scope='session', autouse=True)
+def site_cache_untouched():
+    """Тесты не трогают кэш сайта: у них свой файл во временном каталоге."""
+    with separate_cache():
+        yield
+
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
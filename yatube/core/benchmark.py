@@ -0,0 +1,265 @@
+"""
+Замеры страниц сайта через тестовый клиент Django.
+
+Каждая страница из posts, users и about открывается анонимно и от
+имени пользователя, с холодным и тёплым кэшем, на первой и на дальней
+странице ленты. Для каждого сценария считаются перцентили времени
+ответа, число SQL-запросов и размер ответа. Результат сохраняется в
+JSON и сравнивается с сохранённым ранее.
+"""
+import statistics
+import time
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, F
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from posts.models import Group, Post, PostStats, User, UserStats
+from posts.paginators import CursorPaginator, encode_cursor
+
+from .middleware import QueryRecorder
+from .testing import separate_cache
+
+NAMESPACES = ('posts', 'users', 'about')
+USERS = ('anonymous', 'user')
+CACHES = ('cold', 'warm')
+BYTES_TOLERANCE = 0.1
+
+
+def url_names():
+    """Имена всех URL из NAMESPACES вместе с их параметрами."""
+    for resolver in get_resolver().url_patterns:
+        if not isinstance(resolver, URLResolver):
+            continue
+        if resolver.namespace not in NAMESPACES:
+            continue
+        for pattern in resolver.url_patterns:
+            if isinstance(pattern, URLPattern) and pattern.name:
+                yield (
+                    f'{resolver.namespace}:{pattern.name}',
+                    list(pattern.pattern.converters),
+                )
+
+
+class Dataset:
+    """Объекты базы, на которых открываются страницы."""
+
+    def __init__(self):
+        self.author = self.top_user('-followers_count')
+        self.viewer = self.top_user('-following_count')
+        self.group = (
+            Group.objects.annotate(posts_count=Count('posts'))
+            .order_by('-posts_count', 'pk').first()
+        )
+        stats = PostStats.objects.order_by('-comments_count', 'pk').first()
+        self.post = stats.post if stats else Post.objects.first()
+        self.own_post = (
+            self.viewer.posts.first() if self.viewer else None
+        ) or self.post
+
+    def top_user(self, order):
+        stats = UserStats.objects.order_by(order, 'pk').first()
+        return stats.user if stats else User.objects.first()
+
+    def kwargs(self, name, params):
+        post = self.own_post if name == 'posts:post_edit' else self.post
+        values = {
+            'slug': self.group and self.group.slug,
+            'username': self.author and self.author.username,
+            'post_id': post and post.pk,
+            'done': 'done',
+        }
+        if any(values.get(param) is None for param in params):
+            return None
+        return {param: values[param] for param in params}
+
+    def feeds(self):
+        """
+        Ленты, у которых есть дальние страницы:
+        (запрос, поля ключа сортировки, размер страницы).
+        """
+        posts = ('pub_date', 'pk')
+        feeds = {
+            'posts:index': (
+                Post.objects.all(), posts, settings.SELECT_POSTS
+            ),
+        }
+        if self.viewer:
+            feeds['posts:follow_index'] = (
+                Post.objects.filter(timeline_entries__user=self.viewer)
+                .annotate(
+                    feed_date=F('timeline_entries__pub_date'),
+                    feed_id=F('timeline_entries__post_id'),
+                ),
+                ('feed_date', 'feed_id'), settings.SELECT_POSTS,
+            )
+        if self.group:
+            feeds['posts:group_list'] = (
+                self.group.posts.all(), posts, settings.SELECT_POSTS
+            )
+        if self.author:
+            feeds['posts:profile'] = (
+                self.author.posts.all(), posts, settings.SELECT_POSTS
+            )
+        if self.post:
+            comments = (
+                self.post.comments.all(), ('created', 'pk'),
+                settings.SELECT_COMMENTS,
+            )
+            feeds['posts:post_detail'] = comments
+            feeds['posts:post_comments'] = comments
+        return feeds
+
+
+def deep_queries(feed, depth):
+    """
+    Параметры дальней страницы ленты: ?page= через OFFSET и ?after= по
+    курсору на той же глубине. Для коротких лент берётся последняя.
+    """
+    queryset, (date_field, pk_field), per_page = feed
+    paginator = CursorPaginator(queryset, per_page, date_field, pk_field)
+    rows = paginator.object_list.values_list(date_field, pk_field)
+    offset = depth * per_page - 1
+    boundary = rows[offset:offset + 1] or rows.reverse()[:1]
+    queries = {'page': f'?page={depth}'}
+    if boundary:
+        date, pk = boundary[0]
+        position = SimpleNamespace(**{date_field: date, pk_field: pk})
+        queries['cursor'] = (
+            '?after=' + encode_cursor(position, date_field, pk_field)
+        )
+    return queries
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = fraction * (len(ordered) - 1)
+    low = int(index)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+
+def scenarios(dataset, depth):
+    """Сценарии замера: (ключ, адрес, пользователь, кэш)."""
+    feeds = dataset.feeds()
+    for name, params in url_names():
+        kwargs = dataset.kwargs(name, params)
+        if kwargs is None:
+            continue
+        path = reverse(name, kwargs=kwargs)
+        pages = {'shallow': ''}
+        if name in feeds:
+            queries = deep_queries(feeds[name], depth)
+            if name in ('posts:post_detail', 'posts:post_comments'):
+                queries.pop('page')
+            pages.update(
+                (f'deep-{kind}', query) for kind, query in queries.items()
+            )
+        for page, query in pages.items():
+            for user in USERS:
+                if user == 'user' and dataset.viewer is None:
+                    continue
+                for cache_state in CACHES:
+                    key = f'{name} {page} {user} {cache_state}'
+                    viewer = dataset.viewer if user == 'user' else None
+                    if name == 'posts:post_edit' and viewer:
+                        viewer = dataset.own_post.author
+                    yield key, path + query, viewer, cache_state
+
+
+def measure(client, path, user):
+    """
+    Один запрос к странице. Изменения в базе откатываются, поэтому
+    подписки, выход из аккаунта и другие действия не меняют данные.
+    """
+    session = client.cookies.get(settings.SESSION_COOKIE_NAME)
+    if user is not None and not (session and session.value):
+        client.force_login(user)
+    recorder = QueryRecorder()
+    with transaction.atomic(), ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    return response, elapsed, recorder.count
+
+
+def run(repeat=20, depth=50, only=None, progress=None):
+    """Проводит все замеры и возвращает результат для сохранения в JSON."""
+    with separate_cache():
+        dataset = Dataset()
+        results = {}
+        for key, path, user, cache_state in scenarios(dataset, depth):
+            if only and only not in key:
+                continue
+            client = Client()
+            if cache_state == 'warm':
+                measure(client, path, user)
+            timings, queries, sizes = [], [], []
+            for _ in range(repeat):
+                if cache_state == 'cold':
+                    cache.clear()
+                response, elapsed, count = measure(client, path, user)
+                timings.append(elapsed * 1000)
+                queries.append(count)
+                sizes.append(len(response.content))
+            results[key] = {
+                'path': path,
+                'status': response.status_code,
+                'p50_ms': round(percentile(timings, 0.50), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'queries': round(statistics.median(queries)),
+                'bytes': round(statistics.median(sizes)),
+            }
+            if progress:
+                progress(key, results[key])
+        return {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'repeat': repeat,
+                'depth': depth,
+                'posts': Post.objects.count(),
+                'users': User.objects.count(),
+            },
+            'results': results,
+        }
+
+
+def compare(baseline, current, tolerance=0.5, min_ms=2.0):
+    """
+    Сравнивает замеры с базовыми и возвращает список регрессий.
+
+    Время сравнивается по медиане: p95 и p99 на десятках повторов
+    слишком шумные для автоматической проверки. Регрессия по времени —
+    рост p50 больше чем на tolerance и не меньше чем на min_ms. Число
+    запросов и размер ответа от запуска к запуску не меняются, поэтому
+    для них порог строже: любой рост запросов и рост размера больше
+    BYTES_TOLERANCE.
+    """
+    regressions = []
+    base_results = baseline['results']
+    for key, result in current['results'].items():
+        base = base_results.get(key)
+        if base is None:
+            continue
+        p50, base_p50 = result['p50_ms'], base['p50_ms']
+        if p50 > base_p50 * (1 + tolerance) and p50 - base_p50 >= min_ms:
+            regressions.append(f'{key}: p50 {base_p50} -> {p50} мс')
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{key}: запросов {base["queries"]} -> {result["queries"]}'
+            )
+        if result['bytes'] > base['bytes'] * (1 + BYTES_TOLERANCE):
+            regressions.append(
+                f'{key}: байт {base["bytes"]} -> {result["bytes"]}'
+            )
+    return regressions
@@ -0,0 +1,285 @@
+"""
+Кэш в файле SQLite, общий для всех процессов сайта на одной машине.
+
+LocMemCache у каждого процесса свой: страница, закэшированная одним
+воркером, не видна остальным, а поколение ленты, увеличенное в одном,
+не сбрасывает кэш в других. Этот бэкенд хранит записи в одном файле
+SQLite в режиме WAL: читатели не ждут писателя, запись атомарна между
+процессами.
+
+Целые числа хранятся как INTEGER, остальное — в pickle. Размер кэша
+ограничен числом записей MAX_ENTRIES и байтами MAX_SIZE: при
+превышении сначала удаляются просроченные записи, потом те, которые
+дольше всех не читали, пока не освободится 1/CULL_FREQUENCY места.
+Время чтения записи обновляется не чаще раза в LRU_RESOLUTION секунд,
+чтобы чтения горячих ключей не становились записями.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/cache/yatube/cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_SIZE': 256 * 2 ** 20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .utils import batches
+
+TABLE = 'cache_entries'
+TOTALS = 'cache_totals'
+CHUNK_SIZE = 500
+
+SCHEMA = (
+    f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, '
+    'used REAL NOT NULL, size INTEGER NOT NULL)',
+    f'CREATE INDEX IF NOT EXISTS {TABLE}_used ON {TABLE} (used)',
+    f'CREATE INDEX IF NOT EXISTS {TABLE}_expires ON {TABLE} (expires)',
+    # Число записей и байт поддерживают триггеры: проверка размера при
+    # каждой записи читает одну строку, а не считает всю таблицу.
+    f'CREATE TABLE IF NOT EXISTS {TOTALS} ('
+    'id INTEGER PRIMARY KEY CHECK (id = 0), '
+    'entries INTEGER NOT NULL, bytes INTEGER NOT NULL)',
+    f'INSERT OR IGNORE INTO {TOTALS} VALUES (0, 0, 0)',
+    f'CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON {TABLE} '
+    f'BEGIN UPDATE {TOTALS} SET entries = entries + 1, '
+    'bytes = bytes + new.size; END',
+    f'CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON {TABLE} '
+    f'BEGIN UPDATE {TOTALS} SET entries = entries - 1, '
+    'bytes = bytes - old.size; END',
+    f'CREATE TRIGGER IF NOT EXISTS {TABLE}_update '
+    f'AFTER UPDATE OF size ON {TABLE} '
+    f'BEGIN UPDATE {TOTALS} SET bytes = bytes - old.size + new.size; END',
+)
+
+UPSERT = (
+    f'INSERT INTO {TABLE} (key, value, expires, used, size) '
+    'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+    'value = excluded.value, expires = excluded.expires, '
+    'used = excluded.used, size = excluded.size'
+)
+LIVE = '(expires IS NULL OR expires > ?)'
+
+
+def encode(value):
+    """Значение для колонки value и его размер в байтах."""
+    if type(value) is int:
+        return value, 8
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return data, len(data)
+
+
+def decode(value):
+    if isinstance(value, int):
+        return value
+    return pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_size = options.get('MAX_SIZE', 64 * 2 ** 20)
+        self.lru_resolution = options.get('LRU_RESOLUTION', 60)
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        """
+        Соединение текущего потока. После fork соединение родителя не
+        используется: у SQLite оно не переживает смену процесса.
+        """
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                for sql in SCHEMA:
+                    connection.execute(sql)
+            self.local.connection = connection
+            self.local.pid = pid
+        return self.local.connection
+
+    def key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        key = self.key(key, version)
+        return self.fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self.key(key, version): key for key in keys}
+        found = self.fetch(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def fetch(self, keys):
+        """Живые записи по готовым ключам и отметка, что их читали."""
+        now = time.time()
+        found, stale = {}, []
+        for chunk in batches(keys, CHUNK_SIZE):
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f'SELECT key, value, used FROM {TABLE} '
+                f'WHERE key IN ({placeholders}) AND {LIVE}', [*chunk, now]
+            )
+            for key, value, used in rows:
+                found[key] = decode(value)
+                if now - used > self.lru_resolution:
+                    stale.append(key)
+        for chunk in batches(stale, CHUNK_SIZE):
+            placeholders = ', '.join('?' * len(chunk))
+            self.connection.execute(
+                f'UPDATE {TABLE} SET used = ? WHERE key IN ({placeholders})',
+                [now, *chunk],
+            )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self.key(key, version), *encode(value))
+            for key, value in data.items()
+        ]
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(UPSERT, [
+                (key, value, expires, now, size)
+                for key, value, size in rows
+            ])
+        self.cull(now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Записывает, только если живой записи нет. Одним запросом."""
+        now = time.time()
+        value, size = encode(value)
+        cursor = self.connection.execute(
+            f'{UPSERT} WHERE {TABLE}.expires <= ?', (
+                self.key(key, version), value,
+                self.get_backend_timeout(timeout), now, size, now,
+            )
+        )
+        if cursor.rowcount:
+            self.cull(now)
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        """
+        Атомарно между процессами: чтение и запись идут в транзакции,
+        которая сразу берёт блокировку записи.
+        """
+        key = self.key(key, version)
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                f'SELECT value FROM {TABLE} WHERE key = ? AND {LIVE}',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = decode(row[0]) + delta
+            connection.execute(
+                f'UPDATE {TABLE} SET value = ?, size = ? WHERE key = ?',
+                (*encode(value), key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        cursor = self.connection.execute(
+            f'UPDATE {TABLE} SET expires = ?, used = ? '
+            f'WHERE key = ? AND {LIVE}', (
+                self.get_backend_timeout(timeout), now,
+                self.key(key, version), now,
+            )
+        )
+        return bool(cursor.rowcount)
+
+    def has_key(self, key, version=None):
+        row = self.connection.execute(
+            f'SELECT 1 FROM {TABLE} WHERE key = ? AND {LIVE}',
+            (self.key(key, version), time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        cursor = self.connection.execute(
+            f'DELETE FROM {TABLE} WHERE key = ?', (self.key(key, version),)
+        )
+        return bool(cursor.rowcount)
+
+    def delete_many(self, keys, version=None):
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                f'DELETE FROM {TABLE} WHERE key = ?',
+                [(self.key(key, version),) for key in keys],
+            )
+
+    def clear(self):
+        self.connection.execute(f'DELETE FROM {TABLE}')
+
+    def totals(self):
+        """Число записей и их размер в байтах."""
+        return self.connection.execute(
+            f'SELECT entries, bytes FROM {TOTALS}'
+        ).fetchone()
+
+    def cull(self, now):
+        """
+        Освобождает место, если кэш вырос больше MAX_ENTRIES записей или
+        MAX_SIZE байт: удаляет просроченные записи, потом самые давно
+        читанные, пока не освободится 1/CULL_FREQUENCY лимита.
+        """
+        entries, size = self.totals()
+        if entries <= self._max_entries and size <= self.max_size:
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+            return
+        max_entries = self._max_entries
+        max_size = self.max_size
+        target_entries = max_entries - max_entries // self._cull_frequency
+        target_size = max_size - max_size // self._cull_frequency
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                f'DELETE FROM {TABLE} WHERE expires <= ?', (now,)
+            )
+            entries, size = self.totals()
+            # Самые давно читанные записи: сколько нужно по числу и
+            # сколько нужно, чтобы их размер покрыл лишние байты.
+            connection.execute(
+                f'DELETE FROM {TABLE} WHERE key IN (SELECT key FROM ('
+                'SELECT key, size, ROW_NUMBER() OVER oldest AS number, '
+                'SUM(size) OVER oldest AS running '
+                f'FROM {TABLE} WINDOW oldest AS (ORDER BY used, key)'
+                ') WHERE number <= ? OR running - size < ?)',
+                (entries - target_entries, size - target_size),
+            )
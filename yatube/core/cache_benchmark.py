@@ -0,0 +1,121 @@
+"""
+Замеры бэкендов кэша: LocMemCache, FileBasedCache и SQLiteCache.
+
+Каждый бэкенд создаётся во временном каталоге и по очереди выполняет
+одни и те же операции: запись, чтение существующего и отсутствующего
+ключа, get_many и incr. Для каждой операции считаются перцентили
+времени в микросекундах и число операций в секунду.
+
+Сценарий shared повторяет работу сайта под несколькими воркерами:
+процессы читают ключи из общего набора и записывают отсутствующие.
+Доля попаданий показывает, видят ли процессы записи друг друга.
+"""
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.utils.module_loading import import_string
+
+from .benchmark import percentile
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+MANY_KEYS = 20
+
+
+def create(name, directory):
+    """Пустой бэкенд name, хранящий данные в directory."""
+    location = {
+        'locmem': f'benchmark-{directory}',
+        'filebased': os.path.join(directory, 'files'),
+        'sqlite': os.path.join(directory, 'cache.sqlite3'),
+    }[name]
+    return import_string(BACKENDS[name])(location, {
+        'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 10 ** 6},
+    })
+
+
+def timed(operation, calls):
+    """Время каждого вызова operation(номер) в микросекундах."""
+    timings = []
+    for number in range(calls):
+        started = time.perf_counter()
+        operation(number)
+        timings.append((time.perf_counter() - started) * 10 ** 6)
+    return {
+        'p50_us': round(percentile(timings, 0.50), 1),
+        'p99_us': round(percentile(timings, 0.99), 1),
+        'ops_per_s': round(calls / (sum(timings) / 10 ** 6)),
+    }
+
+
+def operations(cache, calls, payload):
+    value = os.urandom(payload)
+    keys = [f'key-{number}' for number in range(calls)]
+    cache.set('counter', 0)
+    return {
+        'set': timed(lambda number: cache.set(keys[number], value), calls),
+        'get_hit': timed(lambda number: cache.get(keys[number]), calls),
+        'get_miss': timed(lambda number: cache.get(f'miss-{number}'), calls),
+        'get_many': timed(lambda number: cache.get_many(
+            keys[number:number + MANY_KEYS]
+        ), calls),
+        'incr': timed(lambda number: cache.incr('counter'), calls),
+    }
+
+
+def shared_worker(name, directory, calls, keys, payload, seed):
+    """Воркер сценария shared: возвращает число попаданий."""
+    cache = create(name, directory)
+    value = os.urandom(payload)
+    generator = random.Random(seed)
+    hits = 0
+    for _ in range(calls):
+        key = f'shared-{generator.randrange(keys)}'
+        if cache.get(key) is None:
+            cache.set(key, value)
+        else:
+            hits += 1
+    return hits
+
+
+def shared(name, directory, calls, keys, payload, processes):
+    context = multiprocessing.get_context('fork')
+    started = time.perf_counter()
+    with context.Pool(processes) as pool:
+        hits = pool.starmap(shared_worker, [
+            (name, directory, calls, keys, payload, seed)
+            for seed in range(processes)
+        ])
+    elapsed = time.perf_counter() - started
+    return {
+        'hit_ratio': round(sum(hits) / (calls * processes), 3),
+        'ops_per_s': round(calls * processes / elapsed),
+    }
+
+
+def run(calls=2000, payload=4096, processes=4, keys=500, backends=None):
+    """Замеряет бэкенды и возвращает результат для сохранения в JSON."""
+    results = {}
+    for name in backends or BACKENDS:
+        with tempfile.TemporaryDirectory() as directory:
+            cache = create(name, directory)
+            results[name] = operations(cache, calls, payload)
+            cache.clear()
+            results[name]['shared'] = shared(
+                name, directory, calls, keys, payload, processes
+            )
+    return {
+        'meta': {
+            'calls': calls,
+            'payload': payload,
+            'processes': processes,
+            'keys': keys,
+        },
+        'results': results,
+    }
@@ -0,0 +1,52 @@
+"""
+Дырки в кэшируемых страницах.
+
+Страница рендерится одна для всех посетителей: всё, что зависит от
+пользователя (шапка, кнопки подписки и правки, форма комментария),
+тег {% hole %} заменяет меткой <!--hole:имя:аргументы-->. Страница с
+метками кэшируется целиком, а core.middleware.HoleMiddleware в каждом
+ответе заменяет метки маленькими фрагментами, отрендеренными для
+текущего запроса.
+
+Фрагмент — функция fragment(request, *args), зарегистрированная
+декоратором @hole('имя') и возвращающая HTML. Аргументы — числа и
+строки из тега, они хранятся в метке в JSON.
+"""
+import json
+import re
+from urllib.parse import quote, unquote
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+HOLES = {}
+MARK = '<!--hole:'
+PLACEHOLDER = re.compile(r'<!--hole:(\w+):([^>]*)-->')
+
+
+def hole(name):
+    """Регистрирует функцию фрагмента для меток с этим именем."""
+    def decorator(fragment):
+        HOLES[name] = fragment
+        return fragment
+    return decorator
+
+
+def placeholder(name, *args):
+    if name not in HOLES:
+        raise KeyError(f'Фрагмент {name} не зарегистрирован.')
+    return mark_safe(f'{MARK}{name}:{quote(json.dumps(args))}-->')
+
+
+def fill(request, content):
+    """Заменяет метки страницы фрагментами для этого запроса."""
+    def fragment(match):
+        name, args = match.groups()
+        return HOLES[name](request, *json.loads(unquote(args)))
+
+    return PLACEHOLDER.sub(fragment, content)
+
+
+@hole('header')
+def header(request):
+    return render_to_string('includes/header.html', request=request)
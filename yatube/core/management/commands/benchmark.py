@@ -0,0 +1,85 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет все страницы posts, users и about на текущей базе '
+        '(заполните её командой seed_scale). Сохраняет результат в JSON '
+        'и с флагом --compare сверяет его с базовым замером.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', help='Куда записать результат в формате JSON.'
+        )
+        parser.add_argument(
+            '--compare', metavar='BASELINE',
+            help='Базовый замер; при регрессии команда завершится ошибкой.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Допустимый рост медианы времени, доля от базовой.'
+        )
+        parser.add_argument(
+            '--min-ms', type=float, default=2.0,
+            help='Рост медианы меньше этого числа миллисекунд не считается '
+            'регрессией.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз открыть страницу в каждом сценарии.'
+        )
+        parser.add_argument(
+            '--depth', type=int, default=50,
+            help='Номер дальней страницы ленты.'
+        )
+        parser.add_argument(
+            '--only', help='Замерять только сценарии, ключ которых '
+            'содержит эту строку, например posts:index.'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['depth'] < 1:
+            raise CommandError('--repeat и --depth должны быть больше нуля.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        # Число запросов попадает в результат, предупреждения о бюджетах
+        # на каждый повтор только засоряли бы вывод.
+        queries_logger = logging.getLogger('yatube.queries')
+        level = queries_logger.level
+        queries_logger.setLevel(logging.ERROR)
+        try:
+            current = benchmark.run(
+                repeat=options['repeat'], depth=options['depth'],
+                only=options['only'], progress=self.progress,
+            )
+        finally:
+            queries_logger.setLevel(level)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(current, file, ensure_ascii=False, indent=2)
+        if baseline is None:
+            return
+        regressions = benchmark.compare(
+            baseline, current, tolerance=options['tolerance'],
+            min_ms=options['min_ms'],
+        )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write('Регрессий нет.')
+
+    def progress(self, key, result):
+        self.stdout.write(
+            f'{key}: {result["status"]}, p50 {result["p50_ms"]} мс, '
+            f'p95 {result["p95_ms"]} мс, p99 {result["p99_ms"]} мс, '
+            f'{result["queries"]} запросов, {result["bytes"]} байт'
+        )
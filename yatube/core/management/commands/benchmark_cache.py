@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import cache_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кэша LocMemCache, FileBasedCache и SQLiteCache: '
+        'время операций и долю попаданий при нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', help='Куда записать результат в формате JSON.'
+        )
+        parser.add_argument(
+            '--calls', type=int, default=2000,
+            help='Сколько раз выполнить каждую операцию.'
+        )
+        parser.add_argument(
+            '--payload', type=int, default=4096,
+            help='Размер значения в байтах.'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=4,
+            help='Число процессов в сценарии shared.'
+        )
+        parser.add_argument(
+            '--keys', type=int, default=500,
+            help='Число разных ключей в сценарии shared.'
+        )
+        parser.add_argument(
+            '--backend', action='append', dest='backends',
+            choices=list(cache_benchmark.BACKENDS),
+            help='Замерять только этот бэкенд; можно указать несколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        if min(options['calls'], options['processes'], options['keys']) < 1:
+            raise CommandError(
+                '--calls, --processes и --keys должны быть больше нуля.'
+            )
+        result = cache_benchmark.run(
+            calls=options['calls'], payload=options['payload'],
+            processes=options['processes'], keys=options['keys'],
+            backends=options['backends'],
+        )
+        for name, operations in result['results'].items():
+            for operation, timing in operations.items():
+                if operation == 'shared':
+                    continue
+                self.stdout.write(
+                    f'{name} {operation}: p50 {timing["p50_us"]} мкс, '
+                    f'p99 {timing["p99_us"]} мкс, '
+                    f'{timing["ops_per_s"]} оп/с'
+                )
+            shared = operations['shared']
+            self.stdout.write(
+                f'{name} shared: попаданий {shared["hit_ratio"]:.1%}, '
+                f'{shared["ops_per_s"]} оп/с'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.middleware import single_flight_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько рендеров страниц сэкономило объединение '
+        'одинаковых запросов.'
+    )
+
+    def handle(self, *args, **options):
+        stats = single_flight_stats()
+        self.stdout.write(
+            f'Отрендерено: {stats["renders"]}, '
+            f'отдано без рендера: {stats["saved"]} '
+            f'({stats["saved_ratio"]:.1%}), '
+            f'ответ не раздавался: {stats["unshared"]}, '
+            f'не дождались: {stats["timeouts"]}'
+        )
@@ -0,0 +1,73 @@
+"""
+Счётчики статистики.
+
+Запросы увеличивают счётчики в памяти процесса, а в общий кэш они
+уходят не чаще раза в METRICS_FLUSH_INTERVAL секунд, по операции на
+счётчик. Иначе каждый запрос писал бы в файл кэша, и воркеры ждали бы
+друг друга на его блокировке ради статистики. Значения в кэше отстают
+от каждого работающего процесса не больше чем на этот интервал.
+"""
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class Buffer:
+    """Счётчики процесса, ещё не сброшенные в кэш."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+
+    def add(self, key, delta):
+        """Увеличивает счётчик; True, если пора сбросить счётчики в кэш."""
+        with self.lock:
+            self.counts[key] += delta
+            return (
+                time.monotonic() - self.flushed
+                >= settings.METRICS_FLUSH_INTERVAL
+            )
+
+    def take(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.flushed = time.monotonic()
+        return counts
+
+
+buffer = Buffer()
+
+
+def increment(key, delta=1):
+    if buffer.add(key, delta):
+        flush()
+
+
+def flush():
+    """Переносит накопленные в процессе счётчики в общий кэш."""
+    for key, delta in buffer.take().items():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key, delta)
+
+
+def read(keys):
+    """Счётчики всех процессов вместе с ещё не сброшенными в этом."""
+    flush()
+    found = cache.get_many(keys)
+    return {key: found.get(key, 0) for key in keys}
+
+
+def discard():
+    """Забывает несброшенные счётчики процесса, например между тестами."""
+    buffer.take()
+
+
+atexit.register(flush)
@@ -0,0 +1,270 @@
+import json
+import logging
+import pickle
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from . import holes, metrics, routers
+from .signals import queries_recorded
+
+logger = logging.getLogger('yatube.queries')
+
+PIN_COOKIE = 'primary_until'
+SINGLE_FLIGHT_KEY = 'core:single_flight'
+SINGLE_FLIGHT_COUNTERS = ('renders', 'saved', 'unshared', 'timeouts')
+IN_LIST = re.compile(r'IN \((%s, )*%s\)')
+SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Шаблон запроса без параметров: одинаков для всех N+1 повторов."""
+    return IN_LIST.sub('IN (...)', SPACES.sub(' ', sql)).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper, который считает запросы и время в БД."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return {
+            sql: count
+            for sql, count in self.fingerprints.most_common()
+            if count > 1
+        }
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы каждого запроса к сайту: их число, время в БД и
+    повторяющиеся шаблоны. Пишет статистику в лог yatube.queries,
+    сравнивает её с QUERY_BUDGETS по имени URL, а при
+    QUERY_BUDGET_HEADERS добавляет заголовки X-Query-*.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        stats = {
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_time_ms': round(recorder.duration * 1000, 3),
+            'duplicates': recorder.duplicates(),
+            'budget': budget,
+        }
+        response.query_stats = stats
+        queries_recorded.send(sender=self.__class__, request=request,
+                              stats=stats)
+        message = json.dumps(stats, ensure_ascii=False)
+        if budget is not None and recorder.count > budget:
+            logger.warning(message)
+        else:
+            logger.info(message)
+        if settings.QUERY_BUDGET_HEADERS:
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time-Ms'] = stats['db_time_ms']
+            response['X-Query-Duplicates'] = sum(
+                count - 1 for count in stats['duplicates'].values()
+            )
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Разрешает чтение с реплик GET-запросам к вьюхам из REPLICA_VIEWS.
+    После записи посетитель получает cookie и REPLICA_PIN_SECONDS читает
+    только основную базу: редирект после создания поста покажет пост,
+    даже если реплика отстаёт. Стоит раньше SessionMiddleware, чтобы
+    заметить и запись сессии.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = routers.RequestState()
+        token = routers.request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.request_state.reset(token)
+        if state.wrote:
+            pin = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + pin:.3f}', max_age=pin,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = routers.request_state.get()
+        if state is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.view_name not in settings.REPLICA_VIEWS:
+            return None
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state.replicas_allowed = not pinned
+        return None
+
+
+class Flight:
+    """Запрос, который рендерит страницу для всех одинаковых запросов."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+
+
+def count_flight(name):
+    metrics.increment(f'{SINGLE_FLIGHT_KEY}:{name}')
+
+
+def single_flight_stats():
+    """
+    Счётчики объединения запросов по всем процессам: renders — первые
+    из одинаковых запросов, которые рендерили страницу, saved —
+    получившие их ответ, unshared — ждавшие ответ, который нельзя
+    раздать, timeouts — не дождавшиеся его.
+    """
+    counts = metrics.read([
+        f'{SINGLE_FLIGHT_KEY}:{name}' for name in SINGLE_FLIGHT_COUNTERS
+    ])
+    stats = {
+        name: counts[f'{SINGLE_FLIGHT_KEY}:{name}']
+        for name in SINGLE_FLIGHT_COUNTERS
+    }
+    total = stats['renders'] + stats['saved']
+    stats['saved_ratio'] = stats['saved'] / total if total else 0.0
+    return stats
+
+
+class SingleFlightMiddleware:
+    """
+    Объединяет одинаковые анонимные GET-запросы к вьюхам из
+    SINGLE_FLIGHT_VIEWS, которые пришли в процесс одновременно: первый
+    рендерит страницу, остальные до SINGLE_FLIGHT_TIMEOUT секунд ждут и
+    получают копию его ответа. Запросы одинаковы, если совпадают хост,
+    путь с параметрами и заголовки SINGLE_FLIGHT_KEY_HEADERS; запросы с
+    cookie, кроме SINGLE_FLIGHT_IGNORED_COOKIES, не объединяются. Ответ,
+    который ставит cookie, не раздаётся: ожидающие рендерят сами.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        key = self.flight_key(request)
+        if key is None:
+            return self.get_response(request)
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if leader:
+            return self.lead(request, key, flight)
+        if not flight.done.wait(settings.SINGLE_FLIGHT_TIMEOUT):
+            count_flight('timeouts')
+            return self.get_response(request)
+        if flight.response is None:
+            count_flight('unshared')
+            return self.get_response(request)
+        count_flight('saved')
+        return pickle.loads(flight.response)
+
+    def lead(self, request, key, flight):
+        try:
+            response = self.get_response(request)
+            if not response.streaming and not response.cookies:
+                # Копия до того, как внешние middleware допишут ответ.
+                flight.response = pickle.dumps(response)
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        count_flight('renders')
+        return response
+
+    def flight_key(self, request):
+        if request.method != 'GET':
+            return None
+        ignored = settings.SINGLE_FLIGHT_IGNORED_COOKIES
+        if any(name not in ignored for name in request.COOKIES):
+            return None
+        if 'HTTP_AUTHORIZATION' in request.META:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.view_name not in settings.SINGLE_FLIGHT_VIEWS:
+            return None
+        return (
+            request.get_host(), request.get_full_path(),
+            *(
+                request.META.get(header, '')
+                for header in settings.SINGLE_FLIGHT_KEY_HEADERS
+            ),
+        )
+
+
+class HoleMiddleware:
+    """
+    Заполняет дырки HTML-ответов. Стоит последним: фрагменты читают
+    пользователя и ставят токен CSRF, поэтому сессия и CSRF должны
+    обработать ответ уже после них.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or 'text/html' not in response.get('Content-Type', '')
+            or holes.MARK.encode() not in response.content
+        ):
+            return response
+        response.content = holes.fill(
+            request, response.content.decode(response.charset)
+        )
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = len(response.content)
+        return response
@@ -0,0 +1,64 @@
+"""
+Чтение с реплик базы.
+
+Реплики из DATABASE_REPLICAS читаются только во время запросов, которым
+это разрешила ReplicaMiddleware: GET к вьюхам из REPLICA_VIEWS от
+посетителя, который ничего не записывал последние REPLICA_PIN_SECONDS.
+Всё остальное, включая запись и команды manage.py, идёт в основную
+базу, а запрос, который что-то записал, дальше читает только её.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+request_state = ContextVar('replica_request_state', default=None)
+
+
+class RequestState:
+    """Что запрос может читать с реплик и что он уже сделал."""
+
+    def __init__(self):
+        self.replicas_allowed = False
+        self.read_replica = False
+        self.wrote = False
+
+
+def read_replica():
+    """Читал ли текущий запрос с реплики."""
+    state = request_state.get()
+    return bool(state and state.read_replica)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = request_state.get()
+        if (
+            state is None or not state.replicas_allowed or state.wrote
+            or not settings.DATABASE_REPLICAS
+        ):
+            return DEFAULT_DB_ALIAS
+        state.read_replica = True
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            # До конца запроса читаем своё из основной базы.
+            state.wrote = True
+        instance = hints.get('instance')
+        if (
+            instance is not None
+            and instance._state.db not in settings.DATABASE_REPLICAS
+        ):
+            # Объект пишется туда, откуда прочитан: так работает и
+            # migrate --database для других баз.
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Отправляется после каждого запроса с собранной статистикой SQL.
+queries_recorded = Signal(providing_args=['request', 'stats'])
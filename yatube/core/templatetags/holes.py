@@ -0,0 +1,11 @@
+from django import template
+
+from ..holes import placeholder
+
+register = template.Library()
+
+
+@register.simple_tag
+def hole(name, *args):
+    """Метка фрагмента, который HoleMiddleware отрендерит для запроса."""
+    return placeholder(name, *args)
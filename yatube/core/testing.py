@@ -0,0 +1,83 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from . import metrics
+from .signals import queries_recorded
+
+
+def query_budget_violations(stats_list):
+    return [
+        stats for stats in stats_list
+        if settings.QUERY_BUDGETS.get(stats['view']) is not None
+        and stats['queries'] > settings.QUERY_BUDGETS[stats['view']]
+    ]
+
+
+def check_query_budgets(test_func):
+    """
+    Декоратор теста: собирает статистику всех запросов к сайту внутри
+    теста и падает, если какая-то страница превысила QUERY_BUDGETS.
+    """
+    @wraps(test_func)
+    def wrapper(self, *args, **kwargs):
+        recorded = []
+
+        def receiver(sender, stats, **kwargs):
+            recorded.append(stats)
+
+        queries_recorded.connect(receiver)
+        try:
+            result = test_func(self, *args, **kwargs)
+        finally:
+            queries_recorded.disconnect(receiver)
+        violations = query_budget_violations(recorded)
+        if violations:
+            self.fail('\n'.join(
+                f'{stats["view"]} {stats["path"]}: {stats["queries"]} '
+                f'запросов при бюджете {stats["budget"]}, '
+                f'повторы: {stats["duplicates"]}'
+                for stats in violations
+            ))
+        return result
+    return wrapper
+
+
+@contextmanager
+def separate_cache():
+    """
+    Кэш по умолчанию в отдельном файле во временном каталоге: тесты и
+    холодные замеры очищают кэш и не должны стирать кэш, общий для
+    воркеров сайта. Набранные за это время счётчики статистики в кэш
+    сайта тоже не попадают.
+    """
+    with tempfile.TemporaryDirectory(prefix='yatube-cache-') as directory:
+        default = {
+            **settings.CACHES['default'],
+            'LOCATION': os.path.join(directory, 'cache.sqlite3'),
+        }
+        try:
+            with override_settings(
+                CACHES={**settings.CACHES, 'default': default}
+            ):
+                yield
+        finally:
+            metrics.discard()
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner, который запускает тесты с separate_cache()."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache = separate_cache()
+        self.cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from core import benchmark
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.reader = User.objects.create_user(username='StasBasov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа title',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(25):
+            cls.post = Post.objects.create(
+                author=cls.author, text=f'Тестовый пост {i}', group=cls.group
+            )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def test_run_covers_users_caches_and_depths(self):
+        """Замер открывает ленту всеми пользователями, с кэшем и без."""
+        result = benchmark.run(repeat=2, depth=2, only='posts:index')
+        self.assertEqual(result['meta']['posts'], 25)
+        keys = set(result['results'])
+        for page in ('shallow', 'deep-page', 'deep-cursor'):
+            for user in benchmark.USERS:
+                for cache_state in benchmark.CACHES:
+                    self.assertIn(
+                        f'posts:index {page} {user} {cache_state}', keys
+                    )
+        shallow = result['results']['posts:index shallow anonymous warm']
+        self.assertEqual(shallow['status'], 200)
+        self.assertEqual(shallow['queries'], 0)
+        self.assertGreater(shallow['bytes'], 0)
+        self.assertLessEqual(shallow['p50_ms'], shallow['p99_ms'])
+
+    def test_run_does_not_change_data(self):
+        """Подписки и отписки во время замера откатываются."""
+        benchmark.run(repeat=1, depth=1, only='follow ')
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(
+            Follow.objects.filter(user=self.reader, author=self.author)
+            .exists()
+        )
+
+    def test_compare_reports_regressions(self):
+        """Сравнение находит рост запросов, размера и медианы времени."""
+        base = {'results': {'page': {
+            'p50_ms': 10.0, 'p95_ms': 20.0, 'queries': 3, 'bytes': 1000,
+        }}}
+        same = {'results': {'page': {
+            'p50_ms': 11.0, 'p95_ms': 40.0, 'queries': 3, 'bytes': 1050,
+        }}}
+        worse = {'results': {'page': {
+            'p50_ms': 30.0, 'p95_ms': 40.0, 'queries': 4, 'bytes': 2000,
+        }}}
+        self.assertEqual(benchmark.compare(base, same), [])
+        self.assertEqual(len(benchmark.compare(base, worse)), 3)
+
+    def test_command_writes_baseline_and_compares(self):
+        """Команда сохраняет замер и падает, если базовый был лучше."""
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command(
+            'benchmark', repeat=1, only='about:', output=path,
+            stdout=StringIO(),
+        )
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        self.assertIn('about:tech shallow anonymous cold', baseline['results'])
+        for result in baseline['results'].values():
+            result['bytes'] //= 2
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file)
+        with self.assertRaises(CommandError):
+            call_command(
+                'benchmark', repeat=1, only='about:', compare=path,
+                stdout=StringIO(),
+            )
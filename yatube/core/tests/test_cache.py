@@ -0,0 +1,102 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from core.cache import SQLiteCache
+
+
+def increment(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {})
+
+    def test_values_and_expiry(self):
+        """Значения читаются как записаны, просроченные не возвращаются."""
+        self.cache.set('object', {'posts': [1, 2]})
+        self.cache.set('number', 5)
+        self.cache.set('short', 'значение', timeout=1)
+        self.assertEqual(self.cache.get('object'), {'posts': [1, 2]})
+        self.assertEqual(self.cache.incr('number', 2), 7)
+        self.assertFalse(self.cache.add('number', 0))
+        self.assertEqual(
+            self.cache.get_many(['number', 'short', 'missing']),
+            {'number': 7, 'short': 'значение'},
+        )
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        time.sleep(1.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 'новое'))
+        self.assertEqual(self.cache.get('short'), 'новое')
+        self.assertTrue(self.cache.delete('short'))
+        self.assertFalse(self.cache.has_key('short'))
+
+    def test_processes_share_entries_and_counters(self):
+        """Записи видны другим процессам, incr из них не теряется."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=(self.path, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(SQLiteCache(self.path, {}).get('counter'), 200)
+
+    def test_culls_least_recently_used(self):
+        """Сверх MAX_ENTRIES удаляются записи, которые давно не читали."""
+        cache = SQLiteCache(self.path, {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'LRU_RESOLUTION': 0,
+        }})
+        for number in range(10):
+            cache.set(f'key-{number}', number)
+        cache.get('key-0')
+        cache.set('key-10', 10)
+        self.assertEqual(cache.totals()[0], 5)
+        self.assertEqual(cache.get('key-0'), 0)
+        self.assertIsNone(cache.get('key-1'))
+        self.assertEqual(cache.get('key-10'), 10)
+
+    def test_culls_by_size(self):
+        """Размер кэша не превышает MAX_SIZE байт."""
+        cache = SQLiteCache(self.path, {'OPTIONS': {'MAX_SIZE': 10000}})
+        for number in range(20):
+            cache.set(f'key-{number}', os.urandom(1000))
+        entries, size = cache.totals()
+        self.assertLessEqual(size, 10000)
+        self.assertGreater(entries, 0)
+        self.assertIsNotNone(cache.get('key-19'))
+
+    def test_benchmark_command(self):
+        """Замер бэкендов показывает, что SQLite общий для процессов."""
+        output = os.path.join(os.path.dirname(self.path), 'result.json')
+        call_command(
+            'benchmark_cache', calls=50, processes=2, keys=10,
+            backend=['locmem', 'sqlite'], output=output, stdout=StringIO(),
+        )
+        with open(output, encoding='utf-8') as file:
+            results = json.load(file)['results']
+        self.assertEqual(set(results), {'locmem', 'sqlite'})
+        self.assertIn('p99_us', results['sqlite']['incr'])
+        self.assertGreaterEqual(
+            results['sqlite']['shared']['hit_ratio'],
+            results['locmem']['shared']['hit_ratio'],
+        )
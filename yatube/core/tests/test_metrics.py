@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from core import metrics
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.discard()
+
+    @override_settings(METRICS_FLUSH_INTERVAL=60)
+    def test_counters_stay_in_memory_until_flush(self):
+        """Счётчики не пишутся в кэш на каждый запрос."""
+        for _ in range(3):
+            metrics.increment('test:counter')
+        self.assertIsNone(cache.get('test:counter'))
+        self.assertEqual(
+            metrics.read(['test:counter', 'test:other']),
+            {'test:counter': 3, 'test:other': 0},
+        )
+        self.assertEqual(cache.get('test:counter'), 3)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_counters_are_flushed_after_interval(self):
+        """По истечении интервала счётчики добавляются к значениям в кэше."""
+        cache.set('test:counter', 5, None)
+        metrics.increment('test:counter', 2)
+        self.assertEqual(cache.get('test:counter'), 7)
@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core import metrics
+from core.middleware import (QueryRecorder, SingleFlightMiddleware,
+                             single_flight_stats)
+from core.testing import check_query_budgets
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.reader = User.objects.create_user(username='StasBasov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа title',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.author, text=f'Тестовый пост {i}', group=cls.group
+            )
+        for i in range(15):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Комментарий {i}'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Smirnov'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+        ]
+
+    @check_query_budgets
+    def test_pages_fit_query_budgets(self):
+        """Страницы укладываются в бюджет SQL-запросов."""
+        for client in (self.guest_client, self.authorized_client):
+            for url in self.urls:
+                cache.clear()
+                client.get(url)
+        self.authorized_client.get(reverse('posts:follow_index'))
+        self.authorized_client.get(reverse('posts:post_create'))
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_budget_violation_fails_test(self):
+        """Превышение бюджета роняет тест с декоратором."""
+        @check_query_budgets
+        def fetch_index(test):
+            test.guest_client.get(reverse('posts:index'))
+
+        with self.assertLogs('yatube.queries', 'WARNING'):
+            with self.assertRaises(AssertionError):
+                fetch_index(self)
+
+    @override_settings(QUERY_BUDGET_HEADERS=True)
+    def test_headers_in_debug_mode(self):
+        """Вне продакшена статистика видна в заголовках ответа."""
+        response = self.guest_client.get(self.urls[0])
+        self.assertEqual(
+            int(response['X-Query-Count']), response.query_stats['queries']
+        )
+        self.assertIn('X-Query-Time-Ms', response)
+        self.assertIn('X-Query-Duplicates', response)
+
+    @override_settings(QUERY_BUDGET_HEADERS=False)
+    def test_no_headers_in_production(self):
+        response = self.guest_client.get(self.urls[0])
+        self.assertNotIn('X-Query-Count', response)
+
+    def test_structured_log(self):
+        """Статистика пишется в лог одной JSON-строкой."""
+        with self.assertLogs('yatube.queries', 'INFO') as logs:
+            response = self.guest_client.get(self.urls[0])
+        stats = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(stats['view'], 'posts:index')
+        self.assertEqual(stats['queries'], response.query_stats['queries'])
+
+    def test_recorder_finds_duplicate_fingerprints(self):
+        """Запросы, отличающиеся только параметрами, считаются повторами."""
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for user in (self.author, self.reader):
+                list(Post.objects.filter(author=user))
+            list(Post.objects.filter(id__in=[1, 2]))
+            list(Post.objects.filter(id__in=[1, 2, 3]))
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(sorted(recorder.duplicates().values()), [2, 2])
+
+
+class SingleFlightMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.discard()
+        self.renders = 0
+        self.cookie = None
+        self.middleware = SingleFlightMiddleware(self.render)
+        self.factory = RequestFactory()
+
+    def render(self, request):
+        self.renders += 1
+        time.sleep(0.3)
+        response = HttpResponse(f'Рендер {self.renders}')
+        if self.cookie:
+            response.set_cookie(self.cookie, 'value')
+        return response
+
+    def concurrent(self, count=3, **extra):
+        responses = []
+
+        def get():
+            request = self.factory.get(reverse('posts:index'), **extra)
+            responses.append(self.middleware(request))
+
+        threads = [threading.Thread(target=get) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_identical_requests_render_once(self):
+        """Одинаковые запросы ждут первого и получают копию его ответа."""
+        responses = self.concurrent()
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(
+            {response.content.decode() for response in responses},
+            {'Рендер 1'},
+        )
+        self.assertEqual(len({id(response) for response in responses}), 3)
+        stats = single_flight_stats()
+        self.assertEqual(stats['renders'], 1)
+        self.assertEqual(stats['saved'], 2)
+        self.assertAlmostEqual(stats['saved_ratio'], 2 / 3)
+
+    def test_requests_with_cookies_are_not_coalesced(self):
+        """Запросы с cookie и разными параметрами рендерятся отдельно."""
+        self.concurrent(HTTP_COOKIE='sessionid=abc')
+        self.assertEqual(self.renders, 3)
+        with override_settings(SINGLE_FLIGHT_IGNORED_COOKIES=('_ga',)):
+            self.concurrent(HTTP_COOKIE='_ga=1')
+        self.assertEqual(self.renders, 4)
+
+    def test_response_with_cookie_is_not_shared(self):
+        """Ответ, который ставит cookie, ожидающие не получают."""
+        self.cookie = 'csrftoken'
+        self.concurrent()
+        self.assertEqual(self.renders, 3)
+        self.assertEqual(single_flight_stats()['unshared'], 2)
+
+    @override_settings(SINGLE_FLIGHT_TIMEOUT=0.05)
+    def test_waiters_give_up_after_timeout(self):
+        """Не дождавшись первого запроса, остальные рендерят сами."""
+        self.concurrent()
+        self.assertEqual(self.renders, 3)
+        self.assertEqual(single_flight_stats()['timeouts'], 2)
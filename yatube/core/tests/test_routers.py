@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.middleware import PIN_COOKIE
+from posts.models import Post, User
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    """Основная база и реплика — две разные базы SQLite."""
+
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        # Реплика отстаёт: автор на ней уже есть, постов ещё нет.
+        cls.author.save(using='replica')
+        Post.objects.create(author=cls.author, text='Пост только в основной')
+        cls.profile = reverse('posts:profile', args=[cls.author.username])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_read_only_views_read_replica(self):
+        """Вьюхи из REPLICA_VIEWS читают реплику, а не основную базу."""
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(self.profile)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries)
+        self.assertNotContains(response, 'Пост только в основной')
+
+    def test_writer_reads_primary_after_redirect(self):
+        """После записи посетитель читает основную базу, пока не истечёт
+        окно."""
+        client = Client()
+        client.force_login(self.author)
+        response = client.post(
+            reverse('posts:post_create'), {'text': 'Свежий пост'}
+        )
+        self.assertRedirects(response, self.profile)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertContains(client.get(self.profile), 'Свежий пост')
+        self.assertFalse(Post.objects.using('replica').exists())
+        del client.cookies[PIN_COOKIE]
+        self.assertNotContains(client.get(self.profile), 'Свежий пост')
+
+    def test_cached_feed_from_replica_is_short_lived(self):
+        """Главная с реплики кэшируется ненадолго и без ETag."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Feed-Cache'], 'MISS')
+        self.assertIn('max-age=10', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,11 @@
+import itertools
+
+
+def batches(iterable, size):
+    """Разбивает итерируемое на списки не длиннее size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
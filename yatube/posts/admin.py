@@ -1,20 +1,24 @@
 from django.contrib import admin
 from .models import Post, Group, Comment, Follow, User
+from .search import filter_posts
 
 
 class CommentInline(admin.TabularInline):
     model = Comment
+    raw_id_fields = ('author',)
 
 
 class FollowerInline(admin.TabularInline):
     model = Follow
     fk_name = 'author'
+    raw_id_fields = ('user',)
     verbose_name_plural = 'Кто подписан на пользователя'
 
 
 class FollowingInline(admin.TabularInline):
     model = Follow
     fk_name = 'user'
+    raw_id_fields = ('author',)
     verbose_name_plural = 'На кого подписан пользователь'
 
 
@@ -38,6 +42,14 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = (
         'group',
     )
+    list_select_related = (
+        'author',
+        'group',
+    )
+    raw_id_fields = (
+        'author',
+    )
+    show_full_result_count = False
     search_fields = (
         'text',
     )
@@ -49,10 +61,66 @@ class PostAdmin(admin.ModelAdmin):
         CommentInline,
     ]
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Список групп для колонки group в list_editable выбирается один
+        # раз на запрос, а не в каждой строке.
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'group':
+            choices = getattr(request, '_group_choices', None)
+            if choices is None:
+                choices = list(formfield.choices)
+                request._group_choices = choices
+            formfield.choices = choices
+        return formfield
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%' по text.
+        if not search_term.strip():
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'created',
+        'author',
+        'post',
+    )
+    list_select_related = (
+        'author',
+        'post',
+    )
+    raw_id_fields = (
+        'author',
+        'post',
+    )
+    show_full_result_count = False
+
+
+class FollowAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'author',
+    )
+    list_select_related = (
+        'user',
+        'author',
+    )
+    raw_id_fields = (
+        'user',
+        'author',
+    )
+    show_full_result_count = False
+
 
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
-admin.site.register(Comment)
-admin.site.register(Follow)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
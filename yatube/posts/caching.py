@@ -0,0 +1,318 @@
+import hashlib
+import inspect
+import math
+import random
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import (get_cache_key, get_max_age, has_vary_header,
+                                learn_cache_key, patch_cache_control)
+
+from core import metrics
+from core.routers import read_replica
+
+from .models import Comment, Group, Post, User
+
+FEED_GENERATION_KEY = 'posts:feed:generation'
+FEED_HITS_KEY = 'posts:feed:hits'
+FEED_MISSES_KEY = 'posts:feed:misses'
+LOCK_POLL_INTERVAL = 0.05
+
+
+def feed_generation():
+    """
+    Текущее поколение ленты. Начальное значение берётся из часов, чтобы
+    после вытеснения ключа не вернуться к одному из старых поколений.
+    """
+    generation = cache.get(FEED_GENERATION_KEY)
+    if generation is None:
+        cache.add(FEED_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(FEED_GENERATION_KEY)
+    return generation
+
+
+def bump_feed_generation():
+    """Делает недействительными все закэшированные страницы ленты."""
+    try:
+        return cache.incr(FEED_GENERATION_KEY)
+    except ValueError:
+        return feed_generation()
+
+
+def feed_cache_stats():
+    """Возвращает число попаданий, промахов и долю попаданий в кэш ленты."""
+    counts = metrics.read([FEED_HITS_KEY, FEED_MISSES_KEY])
+    hits, misses = counts[FEED_HITS_KEY], counts[FEED_MISSES_KEY]
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def per_request(func):
+    """
+    Запоминает результат func(request, ...) на время запроса: версию
+    страницы спрашивают и condition, и кэш, а запрос к базе нужен один.
+    """
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        memo = request.__dict__.setdefault('_per_request', {})
+        # Аргументы по имени: condition и кэш передают их по-разному.
+        arguments = signature.bind(request, *args, **kwargs).arguments
+        key = (func.__name__, *list(arguments.items())[1:])
+        if key not in memo:
+            memo[key] = func(request, *args, **kwargs)
+        return memo[key]
+    return wrapper
+
+
+class CachedPage:
+    """Запись кэша страницы: ответ, его версия и срок свежести."""
+
+    def __init__(self, response, version, fresh_until, delta):
+        self.response = response
+        self.version = version
+        self.fresh_until = fresh_until
+        self.delta = delta
+
+    def is_fresh(self, version):
+        """
+        Свежа ли запись. Незадолго до срока запись с вероятностью,
+        растущей ко сроку и с временем пересчёта, считается устаревшей,
+        чтобы её пересчитал один запрос, а не все сразу после срока.
+        """
+        if self.version != version:
+            return False
+        early = -self.delta * settings.CACHE_EARLY_BETA * math.log(
+            1.0 - random.random()
+        )
+        return time.time() + early < self.fresh_until
+
+
+def should_cache(request, response):
+    """Те же условия, что у UpdateCacheMiddleware."""
+    if response.streaming or response.status_code != 200:
+        return False
+    if (
+        not request.COOKIES and response.cookies
+        and has_vary_header(response, 'Cookie')
+    ):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def acquire(request, key_prefix, current):
+    """
+    Ответ из кэша или блокировка для пересчёта. Возвращает (ответ, None)
+    или (None, ключ блокировки); ключа нет, если блокировку не дождались.
+    """
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while True:
+        # Пока страница не отдана ни разу, Django не знает её заголовков
+        # Vary и ключа, поэтому блокируется адрес.
+        key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+        lock = f'{key or url_key(request, key_prefix)}.lock'
+        entry = cache.get(key) if key else None
+        if entry and entry.is_fresh(current):
+            return served(entry, 'HIT'), None
+        if cache.add(lock, True, settings.CACHE_LOCK_TIMEOUT):
+            return None, lock
+        if entry:
+            return served(entry, 'STALE'), None
+        if time.monotonic() > deadline:
+            # Блокировку взяли, но записи так и нет: считаем сами.
+            return None, None
+        time.sleep(LOCK_POLL_INTERVAL)
+
+
+def store(request, response, current, delta, timeout, key_prefix):
+    """
+    Кладёт ответ в кэш на timeout или max-age и CACHE_STALE_TIME. Срок
+    кэша сервера браузеру не передаётся: без своего max-age ответ
+    получает no-cache, и браузер каждый раз переспрашивает страницу по
+    ETag, чтобы после записи сразу увидеть свой пост или комментарий.
+    """
+    fresh = get_max_age(response)
+    if fresh is None:
+        patch_cache_control(response, no_cache=True)
+    if not should_cache(request, response):
+        return
+    if fresh is None:
+        fresh = settings.CACHE_TIME if timeout is None else timeout
+    if fresh == 0:
+        return
+    lifetime = fresh + settings.CACHE_STALE_TIME
+    key = learn_cache_key(request, response, lifetime, key_prefix, cache=cache)
+    entry = CachedPage(response, current, time.time() + fresh, delta)
+
+    def set_entry(response):
+        cache.set(key, entry, lifetime)
+
+    if hasattr(response, 'render') and callable(response.render):
+        response.add_post_render_callback(set_entry)
+    else:
+        set_entry(response)
+
+
+def cache_view(timeout=None, version=None, key_prefix=''):
+    """
+    Замена cache_page, которая не даёт всем запросам пересчитывать
+    страницу разом. Запись живёт timeout (или max-age ответа) и ещё
+    CACHE_STALE_TIME после него. Устаревшую запись — по сроку или
+    потому что version(request, ...) изменилась — пересчитывает один
+    запрос, взявший блокировку в общем кэше, остальные получают
+    устаревшую страницу. Если записи нет совсем, остальные ждут её до
+    CACHE_LOCK_TIMEOUT. Заголовок X-Cache: HIT, STALE или MISS.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            current = version(request, *args, **kwargs) if version else None
+            response, lock = acquire(request, key_prefix, current)
+            if response is not None:
+                return response
+            try:
+                started = time.monotonic()
+                response = view_func(request, *args, **kwargs)
+                delta = time.monotonic() - started
+                store(request, response, current, delta, timeout, key_prefix)
+            finally:
+                if lock:
+                    cache.delete(lock)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def served(entry, state):
+    response = entry.response
+    response['X-Cache'] = state
+    return response
+
+
+def url_key(request, key_prefix):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'views.cache.{key_prefix}.{url}'
+
+
+def cache_feed(view_func=None, version=None):
+    """
+    cache_view для лент. Запись устаревает, когда меняется поколение
+    ленты или версия страницы version(request, ...) без учёта
+    посетителя, поэтому страница живёт CACHE_TIME, но пересчитывается
+    сразу после изменения данных. Всё, что зависит от посетителя,
+    рендерится в дырках (core.holes) поверх общей для всех страницы.
+    Страница, прочитанная с реплики, могла отстать от поколения и живёт
+    только REPLICA_PIN_SECONDS. Заголовок X-Feed-Cache повторяет X-Cache;
+    устаревшая страница в статистике считается попаданием.
+    """
+    if view_func is None:
+        return partial(cache_feed, version=version)
+
+    def page_version(request, *args, **kwargs):
+        return (
+            feed_generation(),
+            version and version(request, *args, **kwargs),
+        )
+
+    def view(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if read_replica():
+            patch_cache_control(
+                response, max_age=settings.REPLICA_PIN_SECONDS
+            )
+        return response
+
+    cached_view = cache_view(version=page_version, key_prefix='feed')(view)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = cached_view(request, *args, **kwargs)
+        state = response['X-Cache']
+        metrics.increment(
+            FEED_MISSES_KEY if state == 'MISS' else FEED_HITS_KEY
+        )
+        response['X-Feed-Cache'] = state
+        return response
+    return wrapper
+
+
+def page_etag(request, *versions):
+    """
+    ETag страницы: поколение ленты, версии данных страницы и посетитель,
+    потому что шапка и формы у каждого свои. Поколение меняют удаления,
+    правки и готовые миниатюры; версии из базы — одна строка по индексу.
+    """
+    viewer = request.user.pk if request.user.is_authenticated else 0
+    raw = '|'.join(
+        str(part) for part in (feed_generation(), viewer, *versions)
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def last_pk(queryset):
+    """Подзапрос: id последней записи, по индексу без подсчёта."""
+    return Subquery(queryset.order_by('-pk').values('pk')[:1])
+
+
+def index_etag(request):
+    # Любое изменение главной ленты меняет поколение, запрос не нужен:
+    # тёплая главная страница, как и с cache_feed, обходится без базы.
+    # Но страница с отстающей реплики получила бы ETag нового поколения
+    # и осталась бы у клиента до следующего, поэтому с репликами главная
+    # обходится без ETag.
+    if settings.DATABASE_REPLICAS:
+        return None
+    return page_etag(request)
+
+
+@per_request
+def group_versions(request, slug):
+    return Group.objects.filter(slug=slug).annotate(
+        last_post=last_pk(Post.objects.filter(group=OuterRef('pk')))
+    ).values_list('pk', 'title', 'description', 'last_post').first()
+
+
+def group_etag(request, slug):
+    versions = group_versions(request, slug)
+    return versions and page_etag(request, *versions)
+
+
+@per_request
+def profile_versions(request, username):
+    return User.objects.filter(username=username).annotate(
+        last_post=last_pk(Post.objects.filter(author=OuterRef('pk')))
+    ).values_list(
+        'pk', 'first_name', 'last_name', 'stats__posts_count',
+        'stats__followers_count', 'stats__following_count', 'last_post',
+    ).first()
+
+
+def profile_etag(request, username):
+    versions = profile_versions(request, username)
+    return versions and page_etag(request, *versions)
+
+
+@per_request
+def post_versions(request, post_id):
+    return Post.objects.filter(pk=post_id).annotate(
+        last_comment=last_pk(Comment.objects.filter(post=OuterRef('pk')))
+    ).values_list(
+        'updated', 'stats__comments_count', 'author__stats__posts_count',
+        'last_comment',
+    ).first()
+
+
+def post_etag(request, post_id):
+    versions = post_versions(request, post_id)
+    return versions and page_etag(request, *versions)
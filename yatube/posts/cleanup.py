@@ -0,0 +1,175 @@
+"""
+Уборка медиафайлов.
+
+Сирота — оригинал в каталоге картинок постов, на который не ссылается
+ни один пост, или миниатюра в каталоге sorl, которая не принадлежит ни
+одной картинке поста. Сироты, их записи в хранилище sorl и задачи
+очереди миниатюр удаляются пачками.
+
+Хранилище sorl и файлы просматриваются раньше, чем посты: картинка,
+загруженная во время уборки, попадёт в список постов и не будет удалена.
+Файлы моложе min_age не трогаются, пока пост с ними ещё сохраняется.
+"""
+import posixpath
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.models import KVStore
+
+from core.utils import batches
+
+from .models import Post, ThumbnailTask
+from .thumbnails import thumbnail_file, variants
+
+IMAGE_FIELD = Post._meta.get_field('image')
+SEPARATOR = '||'
+
+
+class Orphans:
+    """Найденные сироты: файлы с размерами, ключи sorl и задачи."""
+
+    def __init__(self):
+        self.originals = {}
+        self.thumbnails = {}
+        self.keys = []
+        self.tasks = []
+
+    @property
+    def size(self):
+        return (
+            sum(self.originals.values()) + sum(self.thumbnails.values())
+        )
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища, включая вложенные."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+def old_files(storage, directory, min_age):
+    """{имя: размер} файлов каталога, изменённых раньше min_age секунд."""
+    border = timezone.now() - timedelta(seconds=min_age)
+    return {
+        name: storage.size(name)
+        for name in walk(storage, directory)
+        if storage.get_modified_time(name) < border
+    }
+
+
+def keyset(queryset, field, batch_size):
+    """Строки queryset короткими запросами по возрастанию field."""
+    last = None
+    while True:
+        batch = queryset.order_by(field)
+        if last is not None:
+            batch = batch.filter(**{f'{field}__gt': last})
+        rows = list(batch[:batch_size])
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][0]
+
+
+def kvstore_entries(batch_size):
+    """
+    Записи sorl: {ключ картинки: имя файла} и {ключ исходной картинки:
+    ключи её миниатюр}.
+    """
+    images, thumbnails = {}, {}
+    rows = KVStore.objects.filter(
+        key__startswith=sorl_settings.THUMBNAIL_KEY_PREFIX + SEPARATOR
+    ).values_list('key', 'value')
+    for raw_key, value in keyset(rows, 'key', batch_size):
+        _, identity, key = raw_key.split(SEPARATOR, 2)
+        if identity == 'image':
+            images[key] = deserialize(value)['name']
+        elif identity == 'thumbnails':
+            thumbnails[key] = deserialize(value)
+    return images, thumbnails
+
+
+def post_images(batch_size):
+    rows = Post.objects.values_list('pk', 'image')
+    return {image for _, image in keyset(rows, 'pk', batch_size) if image}
+
+
+def find_orphans(min_age=3600, batch_size=1000):
+    storage = IMAGE_FIELD.storage
+    originals = old_files(storage, IMAGE_FIELD.upload_to, min_age)
+    thumbnails = old_files(
+        default.storage, sorl_settings.THUMBNAIL_PREFIX, min_age
+    )
+    images, thumbnail_keys = kvstore_entries(batch_size)
+    referenced = post_images(batch_size)
+
+    sources = {ImageFile(name).key for name in referenced}
+    live_keys = set(sources)
+    live_files = set(referenced)
+    all_variants = variants().values()
+    for name in referenced:
+        for geometry, options in all_variants:
+            file = thumbnail_file(name, geometry, options)
+            live_keys.add(file.key)
+            live_files.add(file.name)
+    for source in sources:
+        live_keys.update(thumbnail_keys.get(source, ()))
+    live_files.update(
+        name for key, name in images.items() if key in live_keys
+    )
+
+    orphans = Orphans()
+    orphans.originals = {
+        name: size for name, size in originals.items()
+        if name not in live_files
+    }
+    orphans.thumbnails = {
+        name: size for name, size in thumbnails.items()
+        if name not in live_files
+    }
+    orphans.keys = [
+        SEPARATOR.join([sorl_settings.THUMBNAIL_KEY_PREFIX, 'image', key])
+        for key in images if key not in live_keys
+    ] + [
+        SEPARATOR.join(
+            [sorl_settings.THUMBNAIL_KEY_PREFIX, 'thumbnails', key]
+        )
+        for key in thumbnail_keys if key not in sources
+    ]
+    tasks = ThumbnailTask.objects.values_list('pk', 'image')
+    orphans.tasks = [
+        pk for pk, image in keyset(tasks, 'pk', batch_size)
+        if image not in referenced
+    ]
+    return orphans
+
+
+def delete_orphans(orphans, batch_size=1000, pause=0.0):
+    """
+    Удаляет сирот пачками. Каждая пачка записей — отдельный короткий
+    запрос, между пачками можно сделать паузу, чтобы не мешать сайту.
+    """
+    for batch in batches(orphans.keys, batch_size):
+        default.kvstore._delete_raw(*batch)
+        time.sleep(pause)
+    for batch in batches(orphans.tasks, batch_size):
+        ThumbnailTask.objects.filter(pk__in=batch).delete()
+        time.sleep(pause)
+    for storage, names in (
+        (IMAGE_FIELD.storage, orphans.originals),
+        (default.storage, orphans.thumbnails),
+    ):
+        for batch in batches(names, batch_size):
+            for name in batch:
+                storage.delete(name)
+            time.sleep(pause)
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, PostStats, User, UserStats
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+POST_COUNTERS = {
+    'comments_count': (Comment, 'post'),
+}
+
+
+def change_user_counter(user_id, field, delta):
+    """
+    Сдвигает счётчик пользователя одним UPDATE, не опуская его ниже нуля.
+    Недостающую строку при росте счётчика пересчитывает с нуля.
+    """
+    updated = UserStats.objects.filter(
+        user_id=user_id, **{f'{field}__gte': -delta}
+    ).update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        recount_user(user_id)
+
+
+def change_post_counter(post_id, field, delta):
+    updated = PostStats.objects.filter(
+        post_id=post_id, **{f'{field}__gte': -delta}
+    ).update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        recount_post(post_id)
+
+
+def counter_subqueries(counters):
+    return {
+        field: Coalesce(
+            Subquery(
+                model.objects.filter(**{fk: OuterRef('pk')})
+                .order_by().values(fk).annotate(count=Count('pk'))
+                .values('count'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+        for field, (model, fk) in counters.items()
+    }
+
+
+def recount_user(user_id):
+    values = User.objects.filter(pk=user_id).order_by().values(
+        **counter_subqueries(USER_COUNTERS)
+    ).get()
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults=values
+    )
+    return stats
+
+
+def recount_post(post_id):
+    values = Post.objects.filter(pk=post_id).order_by().values(
+        **counter_subqueries(POST_COUNTERS)
+    ).get()
+    stats, _ = PostStats.objects.update_or_create(
+        post_id=post_id, defaults=values
+    )
+    return stats
+
+
+def user_stats(user):
+    """Счётчики пользователя; если строки ещё нет, создаёт её."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount_user(user.pk)
+
+
+def post_stats(post):
+    try:
+        return post.stats
+    except PostStats.DoesNotExist:
+        return recount_post(post.pk)
+
+
+def repair(owner_model, stats_model, counters, batch_size):
+    """
+    Сверяет счётчики с данными пачками по batch_size строк и исправляет
+    расхождения, по транзакции на пачку. Возвращает число исправлений.
+    """
+    key = stats_model._meta.pk.name
+    fields = list(counters)
+    actual = owner_model.objects.order_by('pk').annotate(
+        **{f'actual_{field}': expression
+           for field, expression in counter_subqueries(counters).items()}
+    ).values_list('pk', *(f'actual_{field}' for field in fields))
+    repaired = 0
+    last_pk = 0
+    while True:
+        rows = list(actual.filter(pk__gt=last_pk)[:batch_size])
+        if not rows:
+            return repaired
+        last_pk = rows[-1][0]
+        stored = stats_model.objects.in_bulk([row[0] for row in rows])
+        to_create, to_update = [], []
+        for pk, *values in rows:
+            counts = dict(zip(fields, values))
+            stats = stored.get(pk)
+            if stats is None:
+                to_create.append(stats_model(**{f'{key}_id': pk}, **counts))
+            elif any(getattr(stats, f) != v for f, v in counts.items()):
+                for field, value in counts.items():
+                    setattr(stats, field, value)
+                to_update.append(stats)
+        with transaction.atomic():
+            stats_model.objects.bulk_create(to_create)
+            stats_model.objects.bulk_update(to_update, fields)
+        repaired += len(to_create) + len(to_update)
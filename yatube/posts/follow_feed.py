@@ -0,0 +1,283 @@
+"""
+Кэш ленты подписок.
+
+Для каждого пользователя в кэше лежит начало его ленты — FOLLOW_FEED_HEAD
+записей (дата, id поста) — и число записей всей ленты. Первые страницы
+ленты собираются из этого списка, а посты достаются из кэша объектов
+постов пачкой, без запросов к базе для тех, что уже там. Авторы и группы
+лежат в кэше отдельно от постов, чтобы их правка меняла одну запись.
+
+Список пользователя удаляется, когда он подписывается или отписывается
+и когда автор, на которого он подписан, публикует или удаляет пост.
+Ключи подписчиков обычного автора удаляются по тем же id, по которым
+пост раскладывается в ленты. У популярного автора (timeline.is_popular)
+вместо этого меняется версия: списки помнят версии таких авторов на момент
+сборки и при расхождении собираются заново. Так пост популярного автора
+сбрасывает кэш за одну операцию.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.utils import batches
+
+from . import timeline
+from .models import Follow, Group, Post, User
+from .paginators import CursorPage, CursorPaginator, decode_cursor
+
+FEED_KEY = 'follow_feed:{user_id}'
+AUTHOR_VERSION_KEY = 'follow_feed:author:{author_id}'
+EPOCH_KEY = 'follow_feed:epoch'
+OBJECT_KEY = '{model}:{epoch}:{pk}'
+# Поля автора для карточки: пароль и прочее в общий кэш не попадают.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def feed_key(user_id):
+    return FEED_KEY.format(user_id=user_id)
+
+
+def object_key(model, pk, epoch=None):
+    if epoch is None:
+        epoch = cache.get(EPOCH_KEY)
+    return OBJECT_KEY.format(
+        model=model._meta.model_name, epoch=epoch, pk=pk
+    )
+
+
+def versions(keys):
+    """
+    Текущие версии ключей. Начальные значения берутся из часов, как у
+    поколения ленты, чтобы после вытеснения не вернуться к старым.
+    """
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return found
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def head(user):
+    """Начало ленты пользователя из кэша или, если его там нет, из базы."""
+    key = feed_key(user.pk)
+    entry = cache.get(key)
+    if entry is not None and cache.get_many(
+        list(entry['versions'])
+    ) == entry['versions']:
+        return entry
+    popular = timeline.popular_authors(user)
+    # Версии читаются раньше ленты: пост, опубликованный во время
+    # сборки, сменит версию, и список соберётся заново.
+    entry = {'versions': versions([EPOCH_KEY, *(
+        AUTHOR_VERSION_KEY.format(author_id=author_id)
+        for author_id in popular
+    )])}
+    size = settings.FOLLOW_FEED_HEAD
+    _, feed_entries = timeline.feed(user, popular)
+    entries = list(feed_entries[:size + 1])
+    entry['entries'] = entries[:size]
+    entry['count'] = (
+        len(entries) if len(entries) <= size else feed_entries.count()
+    )
+    cache.set(key, entry, settings.CACHE_TIME)
+    return entry
+
+
+def from_cache(model, pks, epoch):
+    """Найденные в кэше объекты model и id тех, которых там нет."""
+    keys = {object_key(model, pk, epoch): pk for pk in set(pks)}
+    found = cache.get_many(list(keys)) if keys else {}
+    objects = {keys[key]: obj for key, obj in found.items()}
+    return objects, [pk for pk in keys.values() if pk not in objects]
+
+
+def to_cache(model, objects, epoch):
+    cache.set_many(
+        {object_key(model, pk, epoch): obj for pk, obj in objects.items()},
+        settings.CARD_CACHE_TIME,
+    )
+
+
+def cached_objects(queryset, pks, epoch):
+    """Объекты по id из кэша; недостающие достаются одним запросом."""
+    objects, missing = from_cache(queryset.model, pks, epoch)
+    if missing:
+        loaded = queryset.in_bulk(missing)
+        to_cache(queryset.model, loaded, epoch)
+        objects.update(loaded)
+    return objects
+
+
+def post_fields():
+    return [
+        *(field.name for field in Post._meta.concrete_fields),
+        *(f'author__{name}' for name in AUTHOR_FIELDS),
+        *(f'group__{field.name}' for field in Group._meta.concrete_fields),
+    ]
+
+
+def hydrate(post_ids, epoch):
+    """
+    Посты по id с авторами и группами из кэша объектов. Ключи содержат
+    эпоху: после загрузки контента старые объекты не читаются. Недостающие
+    посты достаются одним запросом вместе с авторами и группами, а автор
+    и группа поста из кэша берутся из их собственных записей, чтобы их
+    правка была видна сразу. Удалённых постов в ответе нет.
+    """
+    posts, missing = from_cache(Post, post_ids, epoch)
+    loaded = {}
+    if missing:
+        loaded = Post.objects.select_related('author', 'group').only(
+            *post_fields()
+        ).in_bulk(missing)
+        to_cache(Post, loaded, epoch)
+        to_cache(User, {
+            post.author_id: post.author for post in loaded.values()
+        }, epoch)
+        to_cache(Group, {
+            post.group_id: post.group for post in loaded.values()
+            if post.group_id
+        }, epoch)
+    authors = cached_objects(
+        User.objects.only(*AUTHOR_FIELDS),
+        [post.author_id for post in posts.values()], epoch,
+    )
+    groups = cached_objects(Group.objects.all(), [
+        post.group_id for post in posts.values() if post.group_id
+    ], epoch)
+    for post_id, post in list(posts.items()):
+        if post.author_id not in authors:
+            del posts[post_id]
+            continue
+        post.author = authors[post.author_id]
+        post.group = groups.get(post.group_id)
+    posts.update(loaded)
+    return posts
+
+
+class HeadPaginator(CursorPaginator):
+    """CursorPaginator по закэшированному началу ленты."""
+
+    def __init__(self, entries, per_page, count):
+        super(CursorPaginator, self).__init__(entries, per_page)
+        self.date_field = 'feed_date'
+        self.pk_field = 'feed_id'
+        self.count = count
+
+    def complete(self, start, rows):
+        """Есть ли в начале ленты все строки страницы."""
+        return (
+            start + rows <= len(self.object_list)
+            or len(self.object_list) == self.count
+        )
+
+    def head_page(self, query):
+        if query.get('before'):
+            return None
+        after = query.get('after')
+        if after:
+            position = decode_cursor(after)
+            if position is None:
+                return None
+            start = next((
+                index for index, entry in enumerate(self.object_list)
+                if entry < position
+            ), len(self.object_list))
+            if not self.complete(start, self.per_page + 1):
+                return None
+            rows = self.object_list[start:start + self.per_page + 1]
+            if not rows:
+                return None
+            page = CursorPage(
+                rows[:self.per_page], self,
+                has_next=len(rows) > self.per_page, has_previous=True,
+            )
+        else:
+            page = self.get_page(query.get('page'))
+            start = (page.number - 1) * self.per_page
+            if not self.complete(start, min(
+                self.per_page, self.count - start
+            )):
+                return None
+        return page
+
+
+def page(user, query):
+    """
+    Страница ленты подписок из кэша или None, если её там нет: курсор
+    назад или страница дальше начала ленты читаются из базы.
+    """
+    entry = head(user)
+    paginator = HeadPaginator(
+        entry['entries'], settings.SELECT_POSTS, entry['count']
+    )
+    page_obj = paginator.head_page(query)
+    if page_obj is None:
+        return None
+    posts = hydrate(
+        [post_id for _, post_id in page_obj.object_list],
+        entry['versions'][EPOCH_KEY],
+    )
+    object_list = []
+    for pub_date, post_id in page_obj.object_list:
+        post = posts.get(post_id)
+        if post is not None:
+            post.feed_date, post.feed_id = pub_date, post_id
+            object_list.append(post)
+    page_obj.object_list = object_list
+    paginator.set_cursors(page_obj)
+    return page_obj
+
+
+def invalidate_user(user_id):
+    cache.delete(feed_key(user_id))
+
+
+def invalidate_followers(author_id, followers):
+    """
+    Сбрасывает списки подписчиков автора. followers — id подписчиков из
+    timeline.followers(); None у популярного автора, тогда меняется его
+    версия.
+    """
+    if followers is None:
+        bump(AUTHOR_VERSION_KEY.format(author_id=author_id))
+        return
+    for batch in batches(followers, settings.TIMELINE_BATCH_SIZE):
+        cache.delete_many([feed_key(user_id) for user_id in batch])
+
+
+def follow_changed(follow):
+    """
+    Сбрасывает список подписчика. Если автор только что стал популярным,
+    сбрасывает и списки остальных подписчиков: они собраны без его
+    версии и иначе не узнали бы о его новых постах.
+    """
+    invalidate_user(follow.user_id)
+    followers = timeline.followers_count(follow.author_id)
+    if followers == settings.TIMELINE_FANOUT_LIMIT + 1:
+        followers = (
+            Follow.objects.filter(author_id=follow.author_id)
+            .values_list('user_id', flat=True)
+            .iterator(chunk_size=settings.TIMELINE_BATCH_SIZE)
+        )
+        for batch in batches(followers, settings.TIMELINE_BATCH_SIZE):
+            cache.delete_many([feed_key(user_id) for user_id in batch])
+
+
+def forget(instance):
+    """Убирает пост, пользователя или группу из кэша объектов."""
+    cache.delete(object_key(type(instance), instance.pk))
+
+
+def invalidate_all():
+    """Сбрасывает все списки, например после загрузки контента."""
+    bump(EPOCH_KEY)
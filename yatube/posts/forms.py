@@ -1,5 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
 from .models import Post, Comment
+from .uploads import check_pixels, normalize_image
 
 
 class PostForm(forms.ModelForm):
@@ -7,6 +10,22 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, rejected_uploads=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rejected_uploads = rejected_uploads
+
+    def clean_image(self):
+        """Новую картинку уменьшает и пересохраняет без метаданных."""
+        if 'image' in self.rejected_uploads:
+            raise forms.ValidationError(
+                'Файл картинки слишком большой.', code='file_too_large'
+            )
+        image = self.cleaned_data['image']
+        if not isinstance(image, UploadedFile):
+            return image
+        check_pixels(image.image)
+        return normalize_image(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,42 @@
+"""Фрагменты страниц постов, которые зависят от пользователя."""
+from django.template.loader import render_to_string
+
+from core.holes import hole
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@hole('switcher')
+def switcher(request, active):
+    return render_to_string(
+        'posts/includes/switcher.html', {active: True}, request=request
+    )
+
+
+@hole('follow_button')
+def follow_button(request, author_id, username):
+    user = request.user
+    if not user.is_authenticated or user.pk == author_id:
+        return ''
+    following = Follow.objects.filter(author_id=author_id, user=user).exists()
+    return render_to_string('posts/includes/follow_button.html', {
+        'username': username, 'following': following,
+    }, request=request)
+
+
+@hole('post_actions')
+def post_actions(request, post_id, author_id):
+    if request.user.pk != author_id:
+        return ''
+    return render_to_string(
+        'posts/includes/post_actions.html', {'post_id': post_id},
+        request=request,
+    )
+
+
+@hole('comment_form')
+def comment_form(request, post_id):
+    return render_to_string('posts/includes/comment_form.html', {
+        'post_id': post_id, 'form': CommentForm(),
+    }, request=request)
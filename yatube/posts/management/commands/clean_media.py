@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import cleanup
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, на которые не ссылается ни один пост, их '
+        'миниатюры и записи sorl. С флагом --dry-run только показывает, '
+        'сколько места освободится.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Ничего не удалять, только посчитать.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Пауза в секундах между пачками удалений.'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Повторять уборку каждые --interval секунд.'
+        )
+        parser.add_argument('--interval', type=float, default=24 * 60 * 60)
+
+    def handle(self, *args, **options):
+        while True:
+            self.clean(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def clean(self, options):
+        orphans = cleanup.find_orphans(
+            options['min_age'], options['batch_size']
+        )
+        self.stdout.write(
+            f'Оригиналов: {len(orphans.originals)}, '
+            f'миниатюр: {len(orphans.thumbnails)}, '
+            f'записей sorl: {len(orphans.keys)}, '
+            f'задач: {len(orphans.tasks)}'
+        )
+        size = filesizeformat(orphans.size)
+        if options['dry_run']:
+            self.stdout.write(f'Можно освободить: {size}')
+            return
+        cleanup.delete_orphans(
+            orphans, options['batch_size'], options['pause']
+        )
+        self.stdout.write(f'Освобождено: {size}')
@@ -0,0 +1,30 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, группы, посты, комментарии и подписки '
+        'в каталог, по файлу NDJSON на модель. Память не растёт с '
+        'объёмом базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Дописать файлы прерванной выгрузки, а не начинать заново.'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        for model in transfer.CONTENT_MODELS:
+            written = transfer.export_model(
+                model, directory, options['batch_size'], options['resume']
+            )
+            self.stdout.write(f'{transfer.file_name(model)}: {written}')
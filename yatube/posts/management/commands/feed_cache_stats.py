@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import feed_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша главной ленты.'
+
+    def handle(self, *args, **options):
+        stats = feed_cache_stats()
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {stats["hit_ratio"]:.1%}'
+        )
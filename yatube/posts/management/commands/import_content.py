@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает каталог, выгруженный export_content: bulk_create '
+        'пачками без сигналов, затем разом строит ленты, счётчики, '
+        'поисковый индекс и очередь миниатюр. Прерванную загрузку '
+        'продолжает флаг --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить с места, где остановилась прошлая загрузка.'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Нет каталога {directory}.')
+        state = transfer.load_state(directory) if options['resume'] else {}
+        for model in transfer.CONTENT_MODELS:
+            name = transfer.file_name(model)
+
+            def remember(offset, name=name):
+                state[name] = offset
+                transfer.save_state(directory, state)
+
+            started = time.monotonic()
+            try:
+                rows = transfer.import_model(
+                    model, directory, options['batch_size'],
+                    state.get(name, 0), remember,
+                )
+            except (DatabaseError, KeyError, ValueError) as error:
+                raise CommandError(
+                    f'{name}: {error!r}. Загруженные пачки сохранены, '
+                    'продолжить можно с флагом --resume.'
+                )
+            self.stdout.write(
+                f'{name}: {rows} за {time.monotonic() - started:.1f} с'
+            )
+        started = time.monotonic()
+        transfer.rebuild_derived(options['batch_size'])
+        transfer.clear_state(directory)
+        self.stdout.write(
+            f'Ленты, счётчики и индексы: {time.monotonic() - started:.1f} с'
+        )
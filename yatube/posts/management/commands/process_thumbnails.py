@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.caching import bump_feed_generation
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры картинок из очереди в пуле процессов. '
+        'С флагом --loop работает постоянно и ждёт новые задачи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; 0 — обрабатывать в этом процессе.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Сколько задач брать из очереди за раз.'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Не завершаться, когда очередь опустеет.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Пауза в секундах между проверками пустой очереди.'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Поставить в очередь картинки всех постов, например '
+            'после очистки кэша миниатюр.'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            thumbnails.enqueue(*(
+                Post.objects.exclude(image='')
+                .values_list('image', flat=True).distinct()
+            ))
+        total = 0
+        while True:
+            tasks = thumbnails.pending_tasks(options['batch_size'])
+            if tasks:
+                done = thumbnails.process(tasks, options['workers'])
+                if done:
+                    # Страницы ленты с заглушками больше не нужны.
+                    bump_feed_generation()
+                total += done
+            elif options['loop']:
+                time.sleep(options['interval'])
+            else:
+                break
+        self.stdout.write(f'Готовы миниатюры для картинок: {total}')
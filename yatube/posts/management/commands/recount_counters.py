@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Post, PostStats, User, UserStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, подписчиков, подписок '
+        'и комментариев и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк сверять за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = counters.repair(
+            User, UserStats, counters.USER_COUNTERS, batch_size
+        )
+        posts = counters.repair(
+            Post, PostStats, counters.POST_COUNTERS, batch_size
+        )
+        self.stdout.write(
+            f'Исправлено счётчиков: пользователей {users}, постов {posts}'
+        )
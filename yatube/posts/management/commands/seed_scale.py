@@ -0,0 +1,251 @@
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from core.utils import batches
+from posts import counters, timeline
+from posts.bulk import explicit_dates
+from posts.models import (Comment, Follow, Group, Post, PostStats, User,
+                          UserStats)
+
+SENTENCE_POOL_SIZE = 2000
+IMAGE_VARIANTS = 16
+IMAGE_DIR = 'posts/seed'
+GROUP_SHARE = 0.7
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками для нагрузочных замеров. '
+        'При одном и том же --seed данные одинаковы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1.'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.2,
+            help='Показатель степенного закона популярности авторов.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней до --until распределить посты.'
+        )
+        parser.add_argument(
+            '--until', default=None,
+            help='Дата последнего поста, YYYY-MM-DD. По умолчанию сегодня.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя.')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images должно быть от 0 до 1.')
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        self.fake = fake
+        self.sentences = [
+            fake.sentence(nb_words=12) for _ in range(SENTENCE_POOL_SIZE)
+        ]
+        until = options['until']
+        until = (
+            datetime.strptime(until, '%Y-%m-%d') if until
+            else datetime.combine(timezone.now().date(), datetime.min.time())
+        )
+        self.until = timezone.make_aware(until, timezone.utc)
+        self.start = self.until - timedelta(days=options['days'])
+
+        users = self.insert('Пользователи', User, self.users())
+        self.user_ids = list(
+            users.order_by('pk').values_list('pk', flat=True)
+        )
+        first_user = self.user_ids[0]
+        self.rng.shuffle(self.user_ids)
+        self.author_weights = list(itertools.accumulate(
+            1 / rank ** options['alpha']
+            for rank in range(1, len(self.user_ids) + 1)
+        ))
+        groups = self.insert('Группы', Group, self.groups())
+        self.group_ids = list(
+            groups.order_by('pk').values_list('pk', flat=True)
+        )
+        self.images = self.make_images() if options['images'] else []
+        with explicit_dates(
+            Post._meta.get_field('pub_date'), Post._meta.get_field('updated'),
+            Comment._meta.get_field('created'),
+        ):
+            posts = self.insert('Посты', Post, self.posts())
+            self.post_ids = posts.aggregate(
+                first=Min('pk'), last=Max('pk'), count=Count('pk')
+            )
+            self.insert('Комментарии', Comment, self.comments())
+        self.insert(
+            'Подписки', Follow, self.follows(), ignore_conflicts=True
+        )
+        self.derive(first_user)
+
+    def insert(self, label, model, objects, ignore_conflicts=False):
+        """
+        Вставляет объекты пачками, по транзакции на пачку.
+        Возвращает запрос, выбирающий добавленные строки.
+        """
+        last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        started = time.monotonic()
+        for batch in batches(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    batch, ignore_conflicts=ignore_conflicts
+                )
+        added = model.objects.filter(pk__gt=last_pk)
+        self.report(label, added.count(), time.monotonic() - started)
+        return added
+
+    def report(self, label, rows, seconds):
+        rate = rows / seconds if seconds else 0
+        self.stdout.write(
+            f'{label}: {rows} за {seconds:.1f} с ({rate:.0f} строк/с)'
+        )
+
+    def text(self, mu, sigma):
+        """Текст из случайных предложений; длина распределена логнормально."""
+        count = max(1, int(self.rng.lognormvariate(mu, sigma)))
+        return ' '.join(self.rng.choices(self.sentences, k=count))
+
+    def author(self):
+        return self.rng.choices(
+            self.user_ids, cum_weights=self.author_weights
+        )[0]
+
+    def post_date(self, index):
+        span = self.until - self.start
+        return self.start + span * index / max(self.options['posts'], 1)
+
+    def users(self):
+        password = make_password(None)
+        first_names = [self.fake.first_name() for _ in range(200)]
+        last_names = [self.fake.last_name() for _ in range(200)]
+        joined = self.start - timedelta(days=1)
+        offset = User.objects.aggregate(last=Max('pk'))['last'] or 0
+        for number in range(offset + 1, offset + self.options['users'] + 1):
+            yield User(
+                username=f'seed_{number}',
+                first_name=self.rng.choice(first_names),
+                last_name=self.rng.choice(last_names),
+                email=f'seed_{number}@example.com',
+                password=password,
+                date_joined=joined,
+            )
+
+    def groups(self):
+        offset = Group.objects.aggregate(last=Max('pk'))['last'] or 0
+        for number in range(offset + 1, offset + self.options['groups'] + 1):
+            yield Group(
+                title=self.fake.catch_phrase()[:200],
+                slug=f'seed-{number}',
+                description=self.text(0.7, 0.5),
+            )
+
+    def posts(self):
+        images = self.options['images']
+        for index in range(self.options['posts']):
+            date = self.post_date(index)
+            group = None
+            if self.group_ids and self.rng.random() < GROUP_SHARE:
+                group = self.rng.choice(self.group_ids)
+            image = ''
+            if self.images and self.rng.random() < images:
+                image = self.rng.choice(self.images)
+            yield Post(
+                text=self.text(1.0, 0.8),
+                pub_date=date,
+                updated=date,
+                author_id=self.author(),
+                group_id=group,
+                image=image,
+            )
+
+    def comments(self):
+        total = self.post_ids['count']
+        if not total:
+            return
+        first_post = self.post_ids['first']
+        if self.post_ids['last'] - first_post + 1 != total:
+            raise CommandError(
+                'Во время генерации в базу добавили посты, '
+                'id новых постов идут не подряд.'
+            )
+        for _ in range(self.options['comments']):
+            # Свежие посты комментируют чаще старых.
+            index = total - 1 - int(total * self.rng.random() ** 3)
+            created = self.post_date(index) + timedelta(
+                seconds=self.rng.expovariate(1 / 3600)
+            )
+            yield Comment(
+                post_id=first_post + index,
+                author_id=self.rng.choice(self.user_ids),
+                text=self.text(0.3, 0.6),
+                created=created,
+            )
+
+    def follows(self):
+        for _ in range(self.options['follows']):
+            user = self.rng.choice(self.user_ids)
+            author = self.author()
+            if user != author:
+                yield Follow(user_id=user, author_id=author)
+
+    def make_images(self):
+        """
+        Несколько картинок, которые посты используют совместно. Цвета
+        берутся из своего генератора: уже созданные файлы не сдвигают
+        случайную последовательность постов.
+        """
+        rng = random.Random(self.options['seed'])
+        directory = os.path.join(settings.MEDIA_ROOT, IMAGE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        names = []
+        for number in range(IMAGE_VARIANTS):
+            name = f'{IMAGE_DIR}/seed_{number}.jpg'
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            if not os.path.exists(path):
+                Image.new('RGB', (960, 640), color).save(path, 'JPEG')
+            names.append(name)
+        return names
+
+    def derive(self, first_user):
+        """Счётчики и ленты подписок, которые bulk_create не заполняет."""
+        started = time.monotonic()
+        rows = timeline.bulk_backfill(first_user)
+        self.report('Ленты подписок', rows, time.monotonic() - started)
+        started = time.monotonic()
+        repaired = counters.repair(
+            User, UserStats, counters.USER_COUNTERS, self.batch_size
+        ) + counters.repair(
+            Post, PostStats, counters.POST_COUNTERS, self.batch_size
+        )
+        self.report('Счётчики', repaired, time.monotonic() - started)
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts import timeline
+from posts.models import Follow, Timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Дозаполняет ленты подписчиков авторов, которые перестали быть '
+        'популярными, и обрезает ленты подписок до TIMELINE_LENGTH '
+        'записей. С флагом --rebuild сначала заново заполняет их по '
+        'подпискам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--length', type=int, default=settings.TIMELINE_LENGTH,
+            help='Сколько последних записей оставить каждому пользователю.'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Заполнить ленты заново, например после loaddata.'
+        )
+
+    def handle(self, *args, **options):
+        length = options['length']
+        if options['rebuild']:
+            Timeline.objects.all().delete()
+            for follow in Follow.objects.select_related('author').iterator():
+                timeline.backfill(follow)
+        backfilled = timeline.backfill_pending()
+        overflowing = (
+            Timeline.objects.values('user_id')
+            .annotate(entries=Count('id'))
+            .filter(entries__gt=length)
+            .values_list('user_id', flat=True)
+        )
+        trimmed = sum(
+            timeline.trim(user_id, length) for user_id in overflowing
+        )
+        self.stdout.write(f'Авторов с дозаполненными лентами: {backfilled}')
+        self.stdout.write(f'Удалено записей ленты: {trimmed}')
@@ -0,0 +1,144 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:35
+
+import re
+from collections import Counter
+
+from django.db import OperationalError, migrations, models, transaction
+import django.db.models.deletion
+
+WORD = re.compile(r'\w+')
+
+FTS_TABLE = """
+CREATE VIRTUAL TABLE posts_search USING fts5(
+    text, post_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# Пост хранится под rowid = 2 * id, комментарий — под 2 * id + 1.
+FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2, new.text, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_post_update AFTER UPDATE OF text
+    ON posts_post BEGIN
+        UPDATE posts_search SET text = new.text WHERE rowid = new.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_insert AFTER INSERT ON posts_comment
+    BEGIN
+        INSERT INTO posts_search (rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_update AFTER UPDATE OF text
+    ON posts_comment BEGIN
+        UPDATE posts_search SET text = new.text
+        WHERE rowid = new.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_delete AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+]
+
+FTS_FILL = """
+INSERT INTO posts_search (rowid, text, post_id)
+SELECT id * 2, text, id FROM posts_post
+UNION ALL
+SELECT id * 2 + 1, text, post_id FROM posts_comment
+"""
+
+
+def create_fts(connection):
+    """Создаёт таблицу FTS5; False, если SQLite собран без FTS5."""
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(FTS_TABLE)
+    except OperationalError:
+        return False
+    with connection.cursor() as cursor:
+        for trigger in FTS_TRIGGERS:
+            cursor.execute(trigger)
+        cursor.execute(FTS_FILL)
+    return True
+
+
+def fill_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and create_fts(connection):
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    SearchTerm = apps.get_model('posts', 'SearchTerm')
+
+    def entries():
+        for post_id, text in Post.objects.values_list('id', 'text'):
+            words = Counter(word[:64] for word in WORD.findall(text.lower()))
+            for term, count in words.items():
+                yield SearchTerm(term=term, post_id=post_id, count=count)
+        comments = Comment.objects.values_list('id', 'post_id', 'text')
+        for comment_id, post_id, text in comments:
+            words = Counter(word[:64] for word in WORD.findall(text.lower()))
+            for term, count in words.items():
+                yield SearchTerm(
+                    term=term, post_id=post_id, comment_id=comment_id,
+                    count=count
+                )
+
+    SearchTerm.objects.bulk_create(entries(), batch_size=1000)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name in ('post', 'comment'):
+            for event in ('insert', 'update', 'delete'):
+                cursor.execute(
+                    f'DROP TRIGGER IF EXISTS posts_search_{name}_{event}'
+                )
+        cursor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Слово')),
+                ('count', models.PositiveIntegerField(default=1, verbose_name='Повторов')),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Comment')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+            options={
+                'verbose_name': 'Слово поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'post'], name='search_term_idx'),
+        ),
+        migrations.RunPython(fill_search_index, drop_fts),
+    ]
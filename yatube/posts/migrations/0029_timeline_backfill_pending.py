@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0028_thumbnail_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='backfill_pending',
+            field=models.BooleanField(default=False, verbose_name='Ленты подписчиков ждут дозаполнения'),
+        ),
+    ]
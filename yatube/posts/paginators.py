@@ -0,0 +1,141 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+CURSOR_SEPARATOR = '|'
+
+
+def encode_cursor(obj, date_field='pub_date', pk_field='pk'):
+    """Кодирует позицию записи (дата, id) в непрозрачный курсор."""
+    date = getattr(obj, date_field).isoformat()
+    raw = f'{date}{CURSOR_SEPARATOR}{getattr(obj, pk_field)}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает пару (дата, id) или None, если курсор испорчен."""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        date, pk = raw.rsplit(CURSOR_SEPARATOR, 1)
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if date is None:
+        return None
+    return date, pk
+
+
+class CursorPage(Page):
+    """Страница, выбранная по курсору: без COUNT и без OFFSET."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+class CursorPaginator(Paginator):
+    """
+    Паджинатор ленты по ключу (дата, id).
+
+    Параметры ?after= и ?before= выбирают страницу за постоянное время
+    на любой глубине ленты, первая страница читается так же, а ?page=
+    продолжает работать через обычный Paginator. У каждой страницы есть
+    next_cursor и previous_cursor. date_field и pk_field могут быть
+    аннотациями, если лента упорядочена по колонкам связанной таблицы;
+    тогда count_list задаёт запрос, по которому ?page= считает записи без
+    подзапроса с GROUP BY.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 pk_field='pk', count_list=None):
+        self.date_field = date_field
+        self.pk_field = pk_field
+        self.count_list = count_list
+        super().__init__(
+            object_list.order_by(f'-{date_field}', f'-{pk_field}'), per_page
+        )
+
+    @cached_property
+    def count(self):
+        if self.count_list is not None:
+            return self.count_list.count()
+        return super().count
+
+    def get_feed_page(self, query):
+        """
+        Номер страницы из ?page= выбирается обычным Paginator, остальные
+        страницы, включая первую без параметров, — по курсорам без COUNT.
+        """
+        if query.get('page') and not (
+            query.get('after') or query.get('before')
+        ):
+            page = self.get_page(query.get('page'))
+            self.set_cursors(page)
+            return page
+        return self.get_cursor_page(query)
+
+    def get_cursor_page(self, query):
+        """Страница только по курсорам: даже первая обходится без COUNT."""
+        page = None
+        if query.get('after') or query.get('before'):
+            page = self.cursor_page(
+                after=query.get('after'), before=query.get('before')
+            )
+        if page is None:
+            rows = list(self.object_list[:self.per_page + 1])
+            page = CursorPage(
+                rows[:self.per_page], self,
+                has_next=len(rows) > self.per_page, has_previous=False
+            )
+        self.set_cursors(page)
+        return page
+
+    def cursor_page(self, after=None, before=None):
+        position = decode_cursor(after or before)
+        if position is None:
+            return None
+        date, pk = position
+        per_page = self.per_page
+        if after:
+            rows = list(self.object_list.filter(
+                Q(**{f'{self.date_field}__lt': date})
+                | Q(**{self.date_field: date, f'{self.pk_field}__lt': pk})
+            )[:per_page + 1])
+            has_next, has_previous = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            rows = list(self.object_list.filter(
+                Q(**{f'{self.date_field}__gt': date})
+                | Q(**{self.date_field: date, f'{self.pk_field}__gt': pk})
+            ).order_by(self.date_field, self.pk_field)[:per_page + 1])
+            has_next, has_previous = True, len(rows) > per_page
+            rows = rows[:per_page][::-1]
+        if not rows:
+            return None
+        return CursorPage(rows, self, has_next, has_previous)
+
+    def set_cursors(self, page):
+        page.next_cursor = page.previous_cursor = None
+        if not len(page):
+            return
+        if page.has_next():
+            page.next_cursor = encode_cursor(
+                page[-1], self.date_field, self.pk_field
+            )
+        if page.has_previous():
+            page.previous_cursor = encode_cursor(
+                page[0], self.date_field, self.pk_field
+            )
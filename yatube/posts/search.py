@@ -0,0 +1,330 @@
+"""
+Полнотекстовый поиск по постам и комментариям.
+
+В SQLite с FTS5 тексты хранятся в виртуальной таблице posts_search,
+которую триггеры из миграции 0027 синхронизируют с постами и
+комментариями: пост лежит под rowid = 2 * id, комментарий — под
+2 * id + 1. В остальных базах используется обратный индекс SearchTerm,
+который обновляют сигналы.
+"""
+import base64
+import binascii
+import re
+from collections import Counter
+from functools import lru_cache, reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Sum
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from core.utils import batches
+
+from .models import Comment, Post, SearchTerm
+
+FTS_TABLE = 'posts_search'
+WORD = re.compile(r'\w+')
+MAX_TERMS = 8
+TERM_LENGTH = 64
+COMMENT_WEIGHT = 0.5
+SNIPPET_WORDS = 16
+MARK_OPEN = '\x02'
+MARK_CLOSE = '\x03'
+CURSOR_SEPARATOR = '|'
+
+
+def terms(text):
+    """Слова текста в нижнем регистре, как их хранит индекс."""
+    return [word[:TERM_LENGTH] for word in WORD.findall(text.lower())]
+
+
+def query_terms(query):
+    return list(dict.fromkeys(terms(query)))[:MAX_TERMS]
+
+
+@lru_cache(maxsize=None)
+def fts_table_exists(database):
+    # Имя базы — ключ кэша: у тестов своя база, у сайта своя.
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def use_fts():
+    """Есть ли в текущей базе таблица FTS5."""
+    return (
+        connection.vendor == 'sqlite'
+        and fts_table_exists(connection.settings_dict['NAME'])
+    )
+
+
+def match_expression(words):
+    """Запрос FTS5: все слова по префиксу. Кавычки в словах не бывает."""
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def encode_cursor(score, post_id):
+    raw = f'{score!r}{CURSOR_SEPARATOR}{post_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        score, post_id = raw.rsplit(CURSOR_SEPARATOR, 1)
+        return float(score), int(post_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и превращает метки совпадений в <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_OPEN, '<mark>')
+        .replace(MARK_CLOSE, '</mark>')
+    )
+
+
+def make_snippet(text, words):
+    """Фрагмент текста вокруг первого совпадения, с метками совпадений."""
+    tokens = list(WORD.finditer(text))
+    matches = [
+        index for index, token in enumerate(tokens)
+        if token.group().lower().startswith(tuple(words))
+    ]
+    if not matches:
+        return None
+    first = max(matches[0] - SNIPPET_WORDS // 4, 0)
+    last = min(first + SNIPPET_WORDS, len(tokens)) - 1
+    parts = ['…'] if first else []
+    position = tokens[first].start()
+    for index in range(first, last + 1):
+        token = tokens[index]
+        parts.append(text[position:token.start()])
+        if index in matches:
+            parts.append(f'{MARK_OPEN}{token.group()}{MARK_CLOSE}')
+        else:
+            parts.append(token.group())
+        position = token.end()
+    if last < len(tokens) - 1:
+        parts.append('…')
+    return ''.join(parts)
+
+
+class SearchPage:
+    """Страница результатов: посты со сниппетами и курсор следующей."""
+
+    def __init__(self, posts, next_cursor):
+        self.posts = posts
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def search_posts(query, after=None, per_page=None):
+    """
+    Посты, в тексте которых или в комментариях к которым есть все слова
+    запроса, от самых релевантных. Каждому посту проставляется snippet —
+    найденный фрагмент с подсвеченными словами. Страницы выбираются по
+    курсору (релевантность, id) без OFFSET.
+    """
+    per_page = per_page or settings.SELECT_POSTS
+    words = query_terms(query)
+    if not words:
+        return SearchPage([], None)
+    position = decode_cursor(after) if after else None
+    if use_fts():
+        rows = fts_page(words, position, per_page + 1)
+    else:
+        rows = index_page(words, position, per_page + 1)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for post_id, score, document in rows]
+    )
+    if use_fts():
+        snippets = fts_snippets(words, [row[2] for row in rows])
+    else:
+        snippets = index_snippets(words, posts.values())
+    found = []
+    for post_id, score, document in rows:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        snippet = snippets.get(document) or snippets.get(post_id)
+        post.snippet = highlight(snippet or post.text[:200])
+        found.append(post)
+    return SearchPage(found, next_cursor)
+
+
+def fts_page(words, position, limit):
+    """
+    Строки (id поста, релевантность, rowid лучшего документа). У поста
+    берётся лучший из документов: его текст или один из комментариев,
+    совпадения в комментариях весят вдвое меньше.
+    """
+    having = ''
+    params = [match_expression(words)]
+    if position is not None:
+        having = (
+            'HAVING MIN(score) > %s OR (MIN(score) = %s AND post_id > %s)'
+        )
+        score, post_id = position
+        params += [score, score, post_id]
+    sql = (
+        f'SELECT post_id, MIN(score) AS best, rowid FROM ('
+        f'SELECT rowid, post_id, CASE rowid %% 2 '
+        f'WHEN 1 THEN rank * {COMMENT_WEIGHT} ELSE rank END AS score '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        f') GROUP BY post_id {having} ORDER BY best, post_id LIMIT %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return cursor.fetchall()
+
+
+def fts_snippets(words, documents):
+    if not documents:
+        return {}
+    placeholders = ', '.join(['%s'] * len(documents))
+    sql = (
+        f"SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) "
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+        f'AND rowid IN ({placeholders})'
+    )
+    params = [MARK_OPEN, MARK_CLOSE, SNIPPET_WORDS, match_expression(words)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(documents))
+        return dict(cursor.fetchall())
+
+
+def index_page(words, position, limit):
+    """Та же выборка по обратному индексу SearchTerm."""
+    matches = [Q(term__startswith=word) for word in words]
+    rows = (
+        SearchTerm.objects.filter(reduce(or_, matches))
+        .values('post_id')
+        .annotate(**{
+            f'matched_{index}': Sum('count', filter=match)
+            for index, match in enumerate(matches)
+        })
+        .filter(**{
+            f'matched_{index}__gt': 0 for index in range(len(matches))
+        })
+        .annotate(score=-Sum('count'))
+    )
+    if position is not None:
+        score, post_id = position
+        rows = rows.filter(
+            Q(score__gt=score) | Q(score=score, post_id__gt=post_id)
+        )
+    return [
+        (row['post_id'], row['score'], row['post_id'])
+        for row in rows.order_by('score', 'post_id')[:limit]
+    ]
+
+
+def index_snippets(words, posts):
+    """
+    Фрагменты из текста поста, а если слова только в комментариях —
+    из первого подходящего комментария.
+    """
+    snippets = {}
+    missing = []
+    for post in posts:
+        snippet = make_snippet(post.text, words)
+        if snippet:
+            snippets[post.pk] = snippet
+        else:
+            missing.append(post.pk)
+    if missing:
+        comments = Comment.objects.filter(
+            post_id__in=missing, search_terms__term__startswith=words[0]
+        ).order_by('created').values_list('post_id', 'text')
+        for post_id, text in comments:
+            if post_id not in snippets:
+                snippets[post_id] = make_snippet(text, words)
+    return snippets
+
+
+def filter_posts(queryset, query):
+    """
+    Оставляет в queryset постов те, в тексте которых есть все слова
+    запроса. Используется в админке вместо LIKE по тексту.
+    """
+    words = query_terms(query)
+    if not words:
+        return queryset.none()
+    if use_fts():
+        return queryset.extra(
+            where=[
+                f'{Post._meta.db_table}.id IN (SELECT rowid / 2 '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'AND rowid %% 2 = 0)'
+            ],
+            params=[match_expression(words)],
+        )
+    for word in words:
+        queryset = queryset.filter(pk__in=SearchTerm.objects.filter(
+            comment=None, term__startswith=word
+        ).values('post_id'))
+    return queryset
+
+
+def index_post(post):
+    """Переиндексирует пост в обратном индексе, если FTS5 нет."""
+    if use_fts():
+        return
+    SearchTerm.objects.filter(post=post, comment=None).delete()
+    SearchTerm.objects.bulk_create(
+        SearchTerm(term=term, post=post, count=count)
+        for term, count in Counter(terms(post.text)).items()
+    )
+
+
+def index_comment(comment):
+    if use_fts():
+        return
+    SearchTerm.objects.filter(comment=comment).delete()
+    SearchTerm.objects.bulk_create(
+        SearchTerm(
+            term=term, post_id=comment.post_id, comment=comment, count=count
+        )
+        for term, count in Counter(terms(comment.text)).items()
+    )
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Заново строит обратный индекс SearchTerm после вставки в обход
+    сигналов. Таблицу FTS5 обновляют триггеры, с ней делать нечего.
+    """
+    if use_fts():
+        return
+
+    def entries():
+        for post_id, text in Post.objects.values_list('id', 'text').iterator():
+            for term, count in Counter(terms(text)).items():
+                yield SearchTerm(term=term, post_id=post_id, count=count)
+        comments = Comment.objects.values_list('id', 'post_id', 'text')
+        for comment_id, post_id, text in comments.iterator():
+            for term, count in Counter(terms(text)).items():
+                yield SearchTerm(
+                    term=term, post_id=post_id, comment_id=comment_id,
+                    count=count,
+                )
+
+    SearchTerm.objects.all().delete()
+    for batch in batches(entries(), batch_size):
+        SearchTerm.objects.bulk_create(batch)
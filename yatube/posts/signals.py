@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, follow_feed, search, thumbnails, timeline
+from .caching import bump_feed_generation
+from .models import Comment, Follow, Group, Post, PostStats, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        PostStats.objects.get_or_create(post=instance)
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        followers = timeline.fan_out(instance)
+        # Списки подписчиков сбрасываются по тем же id, без нового запроса.
+        follow_feed.invalidate_followers(instance.author_id, followers)
+        transaction.on_commit(lambda: follow_feed.invalidate_followers(
+            instance.author_id, followers
+        ))
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post_counter(instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_post_counter(instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user_counter(instance.author_id, 'followers_count', 1)
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    timeline.prune(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, raw=False, **kwargs):
+    if instance.image and not raw:
+        thumbnails.enqueue(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_comment(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_feed(sender, raw=False, created=False, update_fields=None,
+                    **kwargs):
+    # Имя автора есть в карточках его постов; новый пользователь и вход,
+    # который меняет только last_login, лент не меняют.
+    if sender is User and (created or update_fields == {'last_login'}):
+        return
+    # Повторный сброс после COMMIT не даёт закэшировать под новым
+    # поколением страницу, прочитанную до завершения транзакции.
+    if not raw:
+        bump_feed_generation()
+        transaction.on_commit(bump_feed_generation)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        follow_feed.follow_changed(instance)
+        transaction.on_commit(
+            lambda: follow_feed.invalidate_user(instance.user_id)
+        )
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_follow_feeds(sender, instance, **kwargs):
+    followers = timeline.followers(instance.author_id)
+    follow_feed.invalidate_followers(instance.author_id, followers)
+    transaction.on_commit(lambda: follow_feed.invalidate_followers(
+        instance.author_id, followers
+    ))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_cached_object(sender, instance, raw=False, **kwargs):
+    if not raw:
+        follow_feed.forget(instance)
+        transaction.on_commit(lambda: follow_feed.forget(instance))
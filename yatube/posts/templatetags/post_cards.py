@@ -0,0 +1,62 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from ..thumbnails import prefetch_thumbnails
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+PREFETCHED_CARDS = '_prefetched_post_cards'
+
+
+def card_key(post):
+    """
+    Ключ карточки меняется при каждом сохранении поста, а также когда
+    меняются имя автора или адрес группы, которые есть в карточке.
+    """
+    version = int(post.updated.timestamp() * 1000000)
+    author = post.author
+    related = '|'.join((
+        author.username, author.get_full_name(),
+        post.group.slug if post.group_id else '',
+    ))
+    digest = hashlib.md5(related.encode()).hexdigest()[:12]
+    return f'post_card:{post.pk}:{version}:{digest}'
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_post_cards(context, posts):
+    """
+    Достаёт из кэша карточки всех постов страницы одним запросом.
+    Для карточек, которых в кэше нет, разом находит миниатюры картинок.
+    """
+    cards = cache.get_many([card_key(post) for post in posts])
+    context[PREFETCHED_CARDS] = cards
+    prefetch_thumbnails(
+        [post for post in posts if card_key(post) not in cards]
+    )
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """
+    Карточка поста из кэша. Карточка не зависит от пользователя,
+    поэтому одна копия служит всем лентам и всем посетителям.
+    """
+    key = card_key(post)
+    prefetched = context.get(PREFETCHED_CARDS)
+    if prefetched is None:
+        card = cache.get(key)
+    else:
+        card = prefetched.get(key)
+    if card is None:
+        card = render_to_string(CARD_TEMPLATE, {'post': post})
+        if not getattr(post, 'thumbnail_pending', False):
+            cache.set(key, card, settings.CARD_CACHE_TIME)
+    return mark_safe(card)
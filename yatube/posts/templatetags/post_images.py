@@ -0,0 +1,51 @@
+from django import template
+from django.conf import settings
+
+from ..thumbnails import formats, prefetch_thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(post):
+    """
+    Всё для <picture> картинки поста: srcset каждого формата из готовых
+    ширин, а для <img> — запасной формат, src и размеры, чтобы вёрстка
+    не прыгала. None, пока нет ни одной миниатюры запасного формата.
+    Если готовы не все варианты, пост помечается thumbnail_pending,
+    чтобы неполную карточку не положили в кэш.
+    """
+    if not post.image:
+        return None
+    prefetch_thumbnails([post])
+    if not all(post.thumbnails.values()):
+        post.thumbnail_pending = True
+    sources = []
+    for image_format in formats():
+        files = [
+            (width, post.thumbnails[image_format, width])
+            for width in settings.POST_THUMBNAIL_WIDTHS
+            if post.thumbnails[image_format, width]
+        ]
+        sources.append({
+            'type': f'image/{image_format.lower()}',
+            'srcset': ', '.join(
+                f'{file.url} {width}w' for width, file in files
+            ),
+            'files': dict(files),
+        })
+    fallback = sources.pop()
+    if not fallback['files']:
+        return None
+    width = settings.POST_THUMBNAIL_RATIO[0]
+    image = fallback['files'].get(width) or max(
+        fallback['files'].items()
+    )[1]
+    return {
+        'sources': [source for source in sources if source['files']],
+        'src': image.url,
+        'srcset': fallback['srcset'],
+        'sizes': settings.POST_THUMBNAIL_SIZES,
+        'width': image.width,
+        'height': image.height,
+    }
@@ -0,0 +1,272 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from ..models import (
+    Comment, Follow, Group, Post, PostStats, ThumbnailTask, Timeline, User,
+    UserStats
+)
+from .. import thumbnails, transfer
+
+MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class SeedScaleTest(TestCase):
+    SEED_OPTIONS = {
+        'users': 30, 'groups': 3, 'posts': 200, 'comments': 100,
+        'follows': 60, 'seed': 7, 'until': '2021-01-01', 'batch_size': 50,
+    }
+
+    def seed(self):
+        call_command('seed_scale', stdout=StringIO(), **self.SEED_OPTIONS)
+
+    def test_seed_scale_creates_consistent_data(self):
+        """seed_scale создаёт данные вместе со счётчиками и лентами."""
+        self.seed()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(UserStats.objects.count(), 30)
+        self.assertEqual(PostStats.objects.count(), 200)
+        busiest = UserStats.objects.order_by('-posts_count').first()
+        self.assertEqual(
+            busiest.posts_count, Post.objects.filter(author=busiest.user_id)
+            .count()
+        )
+        follow = Follow.objects.first()
+        self.assertEqual(
+            Timeline.objects.filter(
+                user=follow.user_id, post__author=follow.author_id
+            ).count(),
+            Post.objects.filter(author=follow.author_id).count(),
+        )
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date')).exists()
+        )
+
+    def test_seed_scale_is_deterministic(self):
+        """При одном seed команда генерирует одинаковые посты."""
+        self.seed()
+        first = list(
+            Post.objects.order_by('pk').values_list('text', 'pub_date')
+        )
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        self.seed()
+        second = list(
+            Post.objects.order_by('pk').values_list('text', 'pub_date')
+        )
+        self.assertEqual(first, second)
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT)
+    def test_existing_images_do_not_change_posts(self):
+        """Уже созданные картинки не меняют сгенерированные посты."""
+        self.addCleanup(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+        options = {**self.SEED_OPTIONS, 'images': 0.5}
+        call_command('seed_scale', stdout=StringIO(), **options)
+        first = list(
+            Post.objects.order_by('pk').values_list('text', 'image')
+        )
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        call_command('seed_scale', stdout=StringIO(), **options)
+        second = list(
+            Post.objects.order_by('pk').values_list('text', 'image')
+        )
+        self.assertEqual(first, second)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CleanMediaTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Smirnov')
+        self.kept = self.post_with_image('kept.jpg')
+        self.replaced = self.post_with_image('old.jpg')
+        self.deleted = self.post_with_image('deleted.jpg')
+        call_command('process_thumbnails', workers=0, stdout=StringIO())
+        self.old_image = self.replaced.image.name
+        self.replaced.image = self.image('new.jpg')
+        self.replaced.save()
+        self.deleted_image = self.deleted.image.name
+        self.deleted.delete()
+        default.storage.save('cache/00/00/stray.jpg', ContentFile(b'x'))
+
+    def post_with_image(self, name):
+        return Post.objects.create(
+            author=self.user, text='Пост', image=self.image(name)
+        )
+
+    def image(self, name):
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'green').save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def clean(self, **options):
+        out = StringIO()
+        call_command('clean_media', min_age=0, stdout=out, **options)
+        return out.getvalue()
+
+    def cache_files(self):
+        return {
+            name for _, _, names in os.walk(os.path.join(MEDIA_ROOT, 'cache'))
+            for name in names
+        }
+
+    def test_dry_run_deletes_nothing(self):
+        """Пробный запуск считает сирот и ничего не удаляет."""
+        before = self.cache_files()
+        output = self.clean(dry_run=True)
+        stale = 2 * len(thumbnails.variants()) + 1
+        self.assertIn(f'Оригиналов: 2, миниатюр: {stale}', output)
+        self.assertNotIn('записей sorl: 0', output)
+        self.assertIn('Можно освободить', output)
+        self.assertEqual(self.cache_files(), before)
+        self.assertTrue(default.storage.exists(self.old_image))
+
+    def test_orphans_are_deleted(self):
+        """Уборка удаляет чужие оригиналы, миниатюры и записи sorl."""
+        self.clean()
+        self.assertFalse(default.storage.exists(self.old_image))
+        self.assertFalse(default.storage.exists(self.deleted_image))
+        self.assertFalse(default.storage.exists('cache/00/00/stray.jpg'))
+        self.assertTrue(default.storage.exists(self.kept.image.name))
+        self.assertTrue(default.storage.exists(self.replaced.image.name))
+        post = Post.objects.get(pk=self.kept.pk)
+        thumbnails.prefetch_thumbnails([post])
+        for thumbnail in post.thumbnails.values():
+            self.assertTrue(default.storage.exists(thumbnail.name))
+        self.assertEqual(
+            set(ThumbnailTask.objects.values_list('image', flat=True)),
+            {self.replaced.image.name},
+        )
+        self.assertIn(
+            'Оригиналов: 0, миниатюр: 0, записей sorl: 0, задач: 0',
+            self.clean(dry_run=True),
+        )
+
+
+class ContentTransferTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        author = User.objects.create_user(username='Smirnov')
+        reader = User.objects.create_user(username='StasBasov')
+        group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+        for i in range(5):
+            post = Post.objects.create(
+                author=author, group=group, text=f'Пост номер {i}'
+            )
+        Comment.objects.create(post=post, author=reader, text='Комментарий')
+        Follow.objects.create(user=reader, author=author)
+        self.posts = list(
+            Post.objects.order_by('pk').values_list('pk', 'pub_date', 'text')
+        )
+
+    def export(self, **options):
+        call_command(
+            'export_content', self.directory, batch_size=2,
+            stdout=StringIO(), **options
+        )
+
+    def wipe(self):
+        for model in reversed(transfer.CONTENT_MODELS):
+            model.objects.all().delete()
+
+    def restore(self, **options):
+        call_command(
+            'import_content', self.directory, batch_size=2,
+            stdout=StringIO(), **options
+        )
+
+    def assert_restored(self):
+        self.assertEqual(
+            list(Post.objects.order_by('pk')
+                 .values_list('pk', 'pub_date', 'text')),
+            self.posts,
+        )
+        reader = User.objects.get(username='StasBasov')
+        self.assertEqual(reader.stats.following_count, 1)
+        self.assertEqual(
+            Timeline.objects.filter(user=reader).count(), len(self.posts)
+        )
+        self.assertEqual(
+            self.client.get(reverse('posts:search'), {'q': 'номер'})
+            .context['page_obj'].posts[0].text[:10],
+            'Пост номер',
+        )
+
+    def test_export_and_import_round_trip(self):
+        """Выгрузка и загрузка сохраняют объекты, даты и производные."""
+        self.export()
+        with open(os.path.join(
+            self.directory, transfer.file_name(Post)
+        ), encoding='utf-8') as file:
+            first = json.loads(file.readline())
+        self.assertEqual(first['model'], 'posts.post')
+        self.assertEqual(first['fields']['text'], 'Пост номер 0')
+        self.wipe()
+        self.restore()
+        self.assert_restored()
+        Post.objects.create(
+            author=User.objects.first(), text='Новый пост после загрузки'
+        )
+
+    def test_export_resumes_after_cut_line(self):
+        """Продолженная выгрузка дописывает файл без повторов."""
+        self.export()
+        path = os.path.join(self.directory, transfer.file_name(Post))
+        with open(path, 'rb+') as file:
+            lines = file.readlines()
+            file.seek(0)
+            file.truncate()
+            file.writelines(lines[:2])
+            file.write(lines[2][:10])
+        self.export(resume=True)
+        with open(path, encoding='utf-8') as file:
+            pks = [json.loads(line)['pk'] for line in file]
+        self.assertEqual(pks, [pk for pk, _, _ in self.posts])
+
+    def test_import_resumes_after_failure(self):
+        """После сбоя загрузка продолжается с последней целой пачки."""
+        self.export()
+        self.wipe()
+        bulk_create = Post.objects.bulk_create
+        calls = []
+
+        def failing(objects, **kwargs):
+            calls.append(len(objects))
+            if len(calls) == 2:
+                raise DatabaseError('сбой')
+            return bulk_create(objects, **kwargs)
+
+        with mock.patch.object(Post.objects, 'bulk_create', failing):
+            with self.assertRaises(CommandError):
+                self.restore()
+        self.assertEqual(Post.objects.count(), 2)
+        self.restore(resume=True)
+        self.assert_restored()
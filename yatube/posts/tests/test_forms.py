@@ -1,16 +1,19 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from PIL import Image
 
 from posts.forms import PostForm, CommentForm
 from ..models import Group, Post, Comment, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+UPLOAD_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -116,7 +119,7 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 text=self.post_3.text,
                 group=self.post_3.group,
-                image=self.post_3.image
+                image__startswith='posts/small'
             ).exists()
         )
 
@@ -141,3 +144,67 @@ class PostCreateFormTests(TestCase):
                              kwargs={'post_id': self.post.id})
                              )
         self.assertTrue(Comment.objects.filter(id=self.comments.id).exists())
+
+
+def photo(size, name='photo.jpg'):
+    """JPEG с EXIF, как с телефона: ориентация — поворот на 90°."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = 'Phone'
+    buffer = BytesIO()
+    Image.new('RGB', size, 'blue').save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=UPLOAD_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=100)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Smirnov')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(UPLOAD_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с фото', 'image': image},
+        )
+
+    def test_photo_is_normalized(self):
+        """Новый пост сохраняет картинку уменьшенной, повёрнутой и без
+        EXIF."""
+        response = self.create(photo((400, 200)))
+        self.assertRedirects(
+            response, reverse('posts:profile', args=[self.user.username])
+        )
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_large_file_is_rejected(self):
+        """Слишком большой файл не сохраняется, форма сообщает об этом."""
+        response = self.create(photo((400, 200)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл картинки слишком большой.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_are_rejected(self):
+        """Картинка с лишними пикселями отклоняется до декодирования."""
+        response = self.create(photo((400, 200)))
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(response.context['form'].has_error(
+            'image', 'too_many_pixels'
+        ))
@@ -1,6 +1,18 @@
-from django.test import TestCase
+import re
+from io import StringIO
+from unittest import skipUnless
 
-from ..models import Group, Post, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, PostStats, User, UserStats
+from ..paginators import encode_cursor
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$')
 
 
 class PostModelTest(TestCase):
@@ -61,3 +73,137 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     self.post._meta.get_field(field).help_text, expected_value)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedQueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Тестовый пост {i}', group=cls.group)
+            for i in range(15)
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.follower_client = Client()
+        self.follower_client.force_login(FeedQueryPlanTest.follower)
+        post = Post.objects.order_by('-pub_date', '-id')[9]
+        cursor = encode_cursor(post)
+        self.feeds = {
+            reverse('posts:index'): self.guest_client,
+            reverse('posts:index') + f'?after={cursor}': self.guest_client,
+            reverse('posts:index') + f'?before={cursor}': self.guest_client,
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}): (
+                self.guest_client
+            ),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+            + f'?after={cursor}': self.guest_client,
+            reverse('posts:profile', kwargs={'username': 'auth'}): (
+                self.follower_client
+            ),
+            reverse('posts:profile', kwargs={'username': 'auth'})
+            + f'?after={cursor}': self.follower_client,
+            reverse('posts:profile', kwargs={'username': 'auth'})
+            + '?page=2': self.follower_client,
+            reverse('posts:post_detail', kwargs={'post_id': post.id}): (
+                self.guest_client
+            ),
+            reverse('posts:follow_index'): self.follower_client,
+            reverse('posts:follow_index') + f'?after={cursor}': (
+                self.follower_client
+            ),
+        }
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_feed_queries_use_indexes(self):
+        """
+        Запросы лент не сканируют таблицы целиком
+        и не сортируют во временном B-дереве.
+        """
+        for url, client in self.feeds.items():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                for step in self.explain(query['sql']):
+                    with self.subTest(url=url, sql=query['sql']):
+                        self.assertNotIn('TEMP B-TREE', step)
+                        self.assertIsNone(FULL_SCAN.match(step), step)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+
+    def get_stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def get_comments_count(self):
+        return PostStats.objects.get(post=self.post).comments_count
+
+    def test_post_create_and_delete_update_posts_count(self):
+        """Создание и удаление поста меняют счётчик постов автора."""
+        post = Post.objects.create(author=self.author, text='Второй пост')
+        self.assertEqual(self.get_stats(self.author).posts_count, 2)
+        post.delete()
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+
+    def test_follow_and_unfollow_update_counts(self):
+        """Подписка и отписка меняют счётчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        self.assertEqual(self.get_stats(self.author).followers_count, 1)
+        self.assertEqual(self.get_stats(self.follower).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.get_stats(self.author).followers_count, 0)
+        self.assertEqual(self.get_stats(self.follower).following_count, 0)
+
+    def test_comments_update_comments_count(self):
+        """Комментарии меняют счётчик комментариев поста."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.follower, text='Комментарий'
+        )
+        self.assertEqual(self.get_comments_count(), 1)
+        comment.delete()
+        self.assertEqual(self.get_comments_count(), 0)
+
+    def test_recount_counters_repairs_drift(self):
+        """Команда recount_counters исправляет расхождения."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        UserStats.objects.filter(user=self.author).update(
+            posts_count=10, followers_count=0
+        )
+        UserStats.objects.filter(user=self.follower).delete()
+        PostStats.objects.filter(post=self.post).update(comments_count=3)
+        call_command('recount_counters', stdout=StringIO())
+        author_stats = self.get_stats(self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(self.get_stats(self.follower).following_count, 1)
+        self.assertEqual(self.get_comments_count(), 0)
+
+    def test_profile_reads_posts_count_from_stats(self):
+        """Профиль берёт число постов из счётчика, а не из COUNT."""
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        response = Client().get(
+            reverse('posts:profile', kwargs={'username': 'auth'})
+        )
+        self.assertEqual(response.context['count'], 42)
@@ -1,16 +1,33 @@
 import shutil
 import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+from uuid import uuid4 as uuid
 
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from django.urls import reverse
 from django import forms
+from PIL import Image
 
+from core import metrics
 
-from ..models import Group, Post, User, Follow
+from .. import follow_feed, thumbnails
+from ..caching import (CachedPage, bump_feed_generation, cache_view,
+                       feed_cache_stats)
+from ..models import (Comment, Follow, Group, Post, ThumbnailTask, User,
+                      UserStats)
+from ..templatetags.post_cards import card_key
+from ..timeline import is_popular
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -258,16 +275,61 @@ class PostPagesTests(TestCase):
         self.assertEqual(self.post_author_4, self.user_1)
         self.assertEqual(self.post_text_4, PostPagesTests.post.text)
         self.assertEqual(self.post_group_4, PostPagesTests.group)
-        post = Post.objects.get(id=self.post_id)
-        post.delete()
+        Post.objects.filter(id=self.post_id).update(text='Без сигналов')
         response_new = self.authorized_author.get(reverse('posts:index'))
         content_new = response_new.content
         self.assertEqual(self.content, content_new)
+        self.assertEqual(response_new['X-Feed-Cache'], 'HIT')
         cache.clear()
         response_new_2 = self.authorized_author.get(reverse('posts:index'))
         content_new_2 = response_new_2.content
         self.assertNotEqual(self.content, content_new_2)
 
+    def test_cache_index_page_invalidated_on_change(self):
+        """
+        Кэш index сбрасывается сразу после
+        создания, изменения и удаления поста,
+        изменения группы и комментария.
+        """
+        changes = {
+            'create': lambda: Post.objects.create(
+                author=self.user_1, text='Новый пост'
+            ),
+            'edit': lambda: self.post.save(),
+            'group': lambda: self.group.save(),
+            'comment': lambda: Comment.objects.create(
+                post=self.post, author=self.user_2, text='Комментарий'
+            ),
+            'delete': lambda: Post.objects.get(id=self.post_id).delete(),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                self.guest_client.get(reverse('posts:index'))
+                change()
+                response = self.guest_client.get(reverse('posts:index'))
+                self.assertEqual(response['X-Feed-Cache'], 'MISS')
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(response['X-Feed-Cache'], 'HIT')
+        self.assertNotContains(response, self.post.text)
+
+    def test_feed_cache_stats_counts_hits_and_misses(self):
+        """Доля попаданий в кэш ленты измеряется."""
+        cache.clear()
+        metrics.discard()
+        for _ in range(4):
+            self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(
+            feed_cache_stats(), {'hits': 3, 'misses': 1, 'hit_ratio': 0.75}
+        )
+
+    def test_cached_index_is_not_shared_with_guests(self):
+        """Главная, закэшированная для автора, не отдаётся гостю."""
+        cache.clear()
+        self.authorized_author.get(reverse('posts:index'))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Выйти')
+        self.assertNotContains(response, 'Пользователь: Smirnov')
+
     def test_following_authorized_user(self):
         """
         Проверка,что авторизованный пользователь
@@ -287,6 +349,18 @@ class PostPagesTests(TestCase):
         follow_2 = Follow.objects.filter(author=self.user_1.id).exists()
         self.assertFalse(follow_2)
 
+    def test_repeated_follow_keeps_one_subscription(self):
+        """Повторная подписка и подписка на себя не создают записей."""
+        url = reverse('posts:profile_follow', kwargs={'username': self.user_1})
+        for _ in range(2):
+            response = self.authorized_client.get(url)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Follow.objects.filter(author=self.user_1).count(), 1)
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user_2})
+        )
+        self.assertFalse(Follow.objects.filter(author=self.user_2).exists())
+
     def test_new_post_create_in_follower_post_list(self):
         """
         Новая запись пользователя появляется
@@ -368,3 +442,893 @@ class PaginatorViewsTest(TestCase):
                     kwargs={'username': PaginatorViewsTest.user}) + '?page=2'
         )
         self.assertEqual(len(response.context['page_obj']), 3)
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Smirnov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа title',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Тестовый пост {i}', group=cls.group)
+            for i in range(13)
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        ]
+        cache.clear()
+
+    def test_next_cursor_page_contains_three_records(self):
+        """По курсору ?after= открывается вторая страница ленты."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first_page = self.guest_client.get(url).context['page_obj']
+                response = self.guest_client.get(
+                    f'{url}?after={first_page.next_cursor}'
+                )
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), 3)
+                self.assertFalse(page_obj.has_next())
+                self.assertEqual(
+                    list(first_page) + list(page_obj),
+                    list(Post.objects.order_by('-pub_date', '-id'))
+                )
+
+    def test_previous_cursor_returns_first_page(self):
+        """По курсору ?before= открывается предыдущая страница ленты."""
+        url = reverse('posts:index')
+        first_page = self.guest_client.get(url).context['page_obj']
+        cache.clear()
+        second_page = self.guest_client.get(
+            f'{url}?after={first_page.next_cursor}'
+        ).context['page_obj']
+        cache.clear()
+        response = self.guest_client.get(
+            f'{url}?before={second_page.previous_cursor}'
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), list(first_page))
+        self.assertFalse(page_obj.has_previous())
+
+    def test_cursor_page_skips_count_and_offset(self):
+        """Страница по курсору читается одним запросом без COUNT."""
+        url = reverse('posts:index')
+        first_page = self.guest_client.get(url).context['page_obj']
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.guest_client.get(f'{url}?after={first_page.next_cursor}')
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """Испорченный курсор возвращает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index') + '?after=broken'
+        )
+        page_obj = response.context['page_obj']
+        self.assertFalse(page_obj.has_previous())
+        self.assertEqual(
+            list(page_obj),
+            list(Post.objects.order_by('-pub_date', '-id')[:10]),
+        )
+
+    def test_first_page_skips_count(self):
+        """Первая страница без параметров читается без COUNT."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.guest_client.get(url)
+                self.assertFalse(any(
+                    'COUNT(' in query['sql'] for query in queries
+                ))
+                self.assertEqual(len(response.context['page_obj']), 10)
+                self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_page_number_uses_paginator(self):
+        """?page= по-прежнему открывает страницу по номеру."""
+        response = self.guest_client.get(reverse('posts:index') + '?page=2')
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(len(page_obj), 3)
+
+
+@override_settings(TIMELINE_LENGTH=5)
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.follower = User.objects.create_user(username='StasBasov')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Тестовый пост {i}')
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(TimelineTest.follower)
+
+    def get_timeline(self):
+        return list(
+            Post.objects.filter(timeline_entries__user=self.follower)
+            .order_by('-timeline_entries__pub_date', '-id')
+        )
+
+    def test_follow_backfills_latest_posts(self):
+        """Подписка добавляет в ленту последние TIMELINE_LENGTH постов."""
+        self.follower_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.get_timeline(), self.posts[:-6:-1])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост сразу попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.get_timeline()[0], post)
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_unfollow_prunes_timeline(self):
+        """Отписка убирает посты автора из ленты."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.get_timeline(), [])
+
+    def test_trim_timelines_command_caps_length(self):
+        """Команда trim_timelines оставляет не больше TIMELINE_LENGTH."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Ещё пост {i}')
+        self.assertEqual(len(self.get_timeline()), 8)
+        call_command('trim_timelines', stdout=StringIO())
+        timeline = self.get_timeline()
+        self.assertEqual(len(timeline), 5)
+        self.assertEqual(
+            timeline, list(self.author.posts.order_by('-pub_date', '-id')[:5])
+        )
+
+    def test_follow_feed_cursor_pages(self):
+        """Лента подписок листается курсорами без пропусков."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        with self.settings(SELECT_POSTS=3):
+            first_page = self.follower_client.get(
+                reverse('posts:follow_index')
+            ).context['page_obj']
+            second_page = self.follower_client.get(
+                reverse('posts:follow_index')
+                + f'?after={first_page.next_cursor}'
+            ).context['page_obj']
+        self.assertEqual(
+            list(first_page) + list(second_page), self.get_timeline()
+        )
+
+    def test_popular_author_is_read_at_query_time(self):
+        """Пост популярного автора не раскладывается, но виден в ленте."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        with self.settings(TIMELINE_FANOUT_LIMIT=0):
+            post = Post.objects.create(author=self.author, text='Новый пост')
+            self.assertNotIn(post, self.get_timeline())
+            cache.clear()
+            response = self.follower_client.get(reverse('posts:follow_index'))
+            self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_author_below_limit_is_backfilled(self):
+        """Когда автор перестаёт быть популярным, его посты возвращаются
+        в ленты подписчиков фоновым проходом, а до тех пор читаются при
+        запросе."""
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=reader, author=self.author)
+        with self.settings(TIMELINE_FANOUT_LIMIT=1):
+            post = Post.objects.create(author=self.author, text='Новый пост')
+            self.assertNotIn(post, self.get_timeline())
+            Follow.objects.get(user=reader).delete()
+            self.assertNotIn(post, self.get_timeline())
+            cache.clear()
+            response = self.follower_client.get(reverse('posts:follow_index'))
+            self.assertEqual(response.context['page_obj'][0], post)
+            call_command('trim_timelines', stdout=StringIO())
+            self.assertFalse(is_popular(self.author.pk))
+        self.assertEqual(self.get_timeline()[0], post)
+
+    def test_author_popular_again_is_not_backfilled(self):
+        """Автора, который снова стал популярным, проход не дозаполняет."""
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=reader, author=self.author)
+        with self.settings(TIMELINE_FANOUT_LIMIT=1):
+            post = Post.objects.create(author=self.author, text='Новый пост')
+            Follow.objects.get(user=reader).delete()
+            Follow.objects.create(user=reader, author=self.author)
+            call_command('trim_timelines', stdout=StringIO())
+            self.assertTrue(is_popular(self.author.pk))
+            self.assertFalse(
+                UserStats.objects.get(user=self.author).backfill_pending
+            )
+        self.assertNotIn(post, self.get_timeline())
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Smirnov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа title',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Первый пост', group=cls.group
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user, text='Второй пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.feeds = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'Smirnov'}),
+        ]
+
+    def test_card_is_shared_between_feeds(self):
+        """Карточка, отрисованная в одной ленте, берётся из кэша в других."""
+        self.guest_client.get(self.feeds[1])
+        Post.objects.filter(id=self.post.id).update(text='Без сигналов')
+        bump_feed_generation()
+        for url in self.feeds:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Первый пост')
+
+    def test_edit_invalidates_only_its_card(self):
+        """Редактирование поста сбрасывает только его карточку."""
+        self.guest_client.get(self.feeds[0])
+        other_key = card_key(self.other_post)
+        self.post.text = 'Отредактированный пост'
+        self.post.save()
+        self.assertIsNotNone(cache.get(other_key))
+        for url in self.feeds:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Отредактированный пост')
+                self.assertNotContains(response, 'Первый пост')
+
+    def test_group_and_author_changes_invalidate_cards(self):
+        """Новый адрес группы и имя автора сразу видны в карточках."""
+        self.guest_client.get(self.feeds[0])
+        self.group.slug = 'new-slug'
+        self.group.save()
+        self.user.first_name = 'Алексей'
+        self.user.save()
+        response = self.guest_client.get(self.feeds[0])
+        self.assertEqual(response['X-Feed-Cache'], 'MISS')
+        self.assertContains(
+            response, reverse('posts:group_list', args=['new-slug'])
+        )
+        self.assertNotContains(
+            response, reverse('posts:group_list', args=['test-slug'])
+        )
+        self.assertContains(response, 'Алексей')
+
+
+class PostCommentsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+        cls.readers = [
+            User.objects.create_user(username=f'reader_{i}') for i in range(3)
+        ]
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}
+        )
+
+    def add_comments(self, number):
+        Comment.objects.bulk_create(
+            Comment(
+                post=self.post,
+                author=self.readers[i % len(self.readers)],
+                text=f'Комментарий {i}',
+            )
+            for i in range(number)
+        )
+
+    @override_settings(SELECT_COMMENTS=20)
+    def test_comments_are_paginated_with_load_more(self):
+        """Комментарии выводятся порциями, остальные подгружаются."""
+        self.add_comments(25)
+        comments = self.guest_client.get(self.url).context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertTrue(comments.has_next())
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+            + f'?after={comments.next_cursor}'
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertFalse(response.context['comments'].has_next())
+        self.assertEqual(
+            len(set(comments) | set(response.context['comments'])), 25
+        )
+
+    def test_post_detail_query_count_does_not_grow(self):
+        """Число запросов post_detail не зависит от числа комментариев."""
+        self.add_comments(5)
+        with CaptureQueriesContext(connection) as few:
+            self.guest_client.get(self.url)
+        self.add_comments(100)
+        with self.assertNumQueries(len(few)):
+            self.guest_client.get(self.url)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.reader = User.objects.create_user(username='StasBasov')
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.url = reverse('posts:search')
+
+    def search(self, query, **params):
+        response = self.guest_client.get(self.url, {'q': query, **params})
+        return response.context['page_obj']
+
+    def create_content(self):
+        self.found = Post.objects.create(
+            author=self.author, text='Пишем <b>код</b> на питоне'
+        )
+        self.commented = Post.objects.create(
+            author=self.author, text='Пост без ключевого слова'
+        )
+        Comment.objects.create(
+            post=self.commented, author=self.reader, text='Я тоже питонист'
+        )
+        Post.objects.create(author=self.author, text='Совсем другой пост')
+
+    def test_search_finds_posts_and_comments_with_snippets(self):
+        """Поиск находит посты по тексту и комментариям, с подсветкой."""
+        self.create_content()
+        page = self.search('Питон')
+        self.assertEqual(list(page), [self.found, self.commented])
+        self.assertIn('<mark>питоне</mark>', page.posts[0].snippet)
+        self.assertIn('&lt;b&gt;код&lt;/b&gt;', page.posts[0].snippet)
+        self.assertIn('<mark>питонист</mark>', page.posts[1].snippet)
+        self.assertEqual(len(self.search('питон другой')), 0)
+        self.assertEqual(len(self.search('')), 0)
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при изменении и удалении постов."""
+        self.create_content()
+        self.found.text = 'Теперь про джанго'
+        self.found.save()
+        self.assertEqual(list(self.search('питон')), [self.commented])
+        self.assertEqual(list(self.search('джанго')), [self.found])
+        self.commented.delete()
+        self.assertEqual(len(self.search('питон')), 0)
+
+    @override_settings(SELECT_POSTS=2)
+    def test_search_is_paginated_by_cursor(self):
+        """Результаты поиска листаются курсором без повторов."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'Питон {i}')
+            for i in range(5)
+        ]
+        seen = []
+        page = self.search('питон')
+        while True:
+            seen += list(page)
+            if not page.has_next():
+                break
+            page = self.search('питон', after=page.next_cursor)
+        self.assertCountEqual(seen, posts)
+        self.assertEqual(len(seen), 5)
+
+    def test_fallback_index_without_fts(self):
+        """Без FTS5 поиск работает по обратному индексу SearchTerm."""
+        with mock.patch('posts.search.use_fts', return_value=False):
+            self.create_content()
+            page = self.search('питон')
+            self.assertEqual(list(page), [self.found, self.commented])
+            self.assertIn('<mark>питоне</mark>', page.posts[0].snippet)
+            self.assertIn('<mark>питонист</mark>', page.posts[1].snippet)
+            self.found.delete()
+            self.assertEqual(list(self.search('питон')), [self.commented])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке постов идёт по тому же индексу."""
+        self.create_content()
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'питон'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.found]
+        )
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='Описание'
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, number):
+        for i in range(number):
+            author = User.objects.create_user(username=f'user-{uuid()}')
+            post = Post.objects.create(
+                author=author, text=f'Пост {i}',
+                group=self.groups[i % len(self.groups)],
+            )
+            Comment.objects.create(post=post, author=author, text='Текст')
+            Follow.objects.create(user=author, author=self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        """Число запросов списков в админке не зависит от числа строк."""
+        urls = [
+            reverse('admin:posts_post_changelist'),
+            reverse('admin:posts_comment_changelist'),
+            reverse('admin:posts_follow_changelist'),
+            reverse('admin:auth_user_change', args=[self.admin.pk]),
+        ]
+        self.add_rows(2)
+        few = [self.count_queries(url) for url in urls]
+        self.add_rows(10)
+        many = [self.count_queries(url) for url in urls]
+        self.assertEqual(few[:3], many[:3])
+        # В подписках пользователи выбираются по id, а не из списка
+        # всех пользователей сайта.
+        response = self.client.get(urls[3])
+        self.assertNotRegex(
+            response.content.decode(), r'<select name="follow(er|ing)-'
+        )
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Smirnov')
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('thumb.jpg', buffer.getvalue()),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:index')
+
+    def test_post_with_image_is_queued(self):
+        """Сохранённый пост с картинкой ставит её в очередь миниатюр."""
+        self.assertTrue(
+            ThumbnailTask.objects.filter(image=self.post.image.name).exists()
+        )
+
+    def test_page_does_not_wait_for_thumbnail(self):
+        """Пока миниатюры нет, страница показывает заглушку и не кэширует
+        карточку."""
+        with mock.patch('sorl.thumbnail.get_thumbnail') as get_thumbnail:
+            response = self.client.get(self.url)
+        get_thumbnail.assert_not_called()
+        self.assertContains(response, 'aspect-ratio')
+        self.assertNotContains(response, '<img class="card-img')
+        self.assertIsNone(cache.get(card_key(self.post)))
+
+    def test_worker_renders_thumbnails(self):
+        """Команда готовит миниатюры и убирает задачи из очереди."""
+        out = StringIO()
+        call_command('process_thumbnails', workers=0, stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertFalse(ThumbnailTask.objects.exists())
+        post = Post.objects.get(pk=self.post.pk)
+        thumbnails.prefetch_thumbnails([post])
+        self.assertIsNotNone(post.thumbnails['JPEG', 960])
+        for url, loading in (
+            (self.url, 'lazy'),
+            (
+                reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+                'eager',
+            ),
+        ):
+            with self.subTest(url=url):
+                content = self.client.get(url).content.decode()
+                self.assertIn('<img class="card-img', content)
+                self.assertIn('width="960" height="339"', content)
+                self.assertIn(f'loading="{loading}"', content)
+                self.assertRegex(
+                    content, r'srcset="\S+ 480w, \S+ 960w, \S+ 1440w"'
+                )
+        self.assertIsNotNone(cache.get(card_key(self.post)))
+
+    def test_page_looks_up_thumbnails_at_once(self):
+        """Миниатюры всех постов страницы ищутся одним запросом."""
+        def count_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+            return len(queries), response
+
+        call_command('process_thumbnails', workers=0, stdout=StringIO())
+        few, _ = count_queries()
+        self.post.image.open()
+        content = self.post.image.read()
+        self.post.image.close()
+        for i in range(3):
+            Post.objects.create(
+                author=self.user, text='Ещё пост',
+                image=SimpleUploadedFile(f'more_{i}.jpg', content),
+            )
+        call_command('process_thumbnails', workers=0, stdout=StringIO())
+        many, response = count_queries()
+        self.assertEqual(few, many)
+        self.assertContains(response, '<img class="card-img', count=4)
+
+    @override_settings(POST_THUMBNAIL_FORMATS=('AVIF', 'WEBP', 'JPEG'))
+    def test_unsupported_formats_are_skipped(self):
+        """Форматы, которые Pillow не сохраняет, в варианты не попадают."""
+        supported = thumbnails.formats()
+        self.assertNotIn('AVIF', supported)
+        self.assertEqual(supported[-1], 'JPEG')
+        self.assertEqual(
+            len(thumbnails.variants()),
+            len(supported) * len(settings.POST_THUMBNAIL_WIDTHS)
+        )
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.reader = User.objects.create_user(username='StasBasov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Тестовый пост'
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.author.username]),
+            reverse('posts:post_detail', args=[cls.post.pk]),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def etags(self, client=None):
+        client = client or self.client
+        return {url: client.get(url)['ETag'] for url in self.urls}
+
+    def test_unchanged_pages_answer_304_without_rendering(self):
+        """Неизменившаяся страница отдаётся 304 без шаблонов."""
+        for url, etag in self.etags().items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+                self.assertLessEqual(len(queries), 1)
+
+    def test_browsers_revalidate_pages(self):
+        """Браузер не хранит страницы по сроку кэша сервера."""
+        reader = Client()
+        reader.force_login(self.reader)
+        for client in (self.client, reader):
+            for url in self.urls:
+                for state in ('MISS', 'HIT'):
+                    with self.subTest(url=url, state=state):
+                        response = client.get(url)
+                        self.assertEqual(response['X-Cache'], state)
+                        self.assertEqual(
+                            response['Cache-Control'], 'no-cache'
+                        )
+                        self.assertFalse(response.has_header('Expires'))
+            cache.clear()
+
+    def test_changes_and_viewer_change_etag(self):
+        """ETag меняется с данными страницы и с посетителем."""
+        before = self.etags()
+        client = Client()
+        client.force_login(self.reader)
+        for url, etag in self.etags(client).items():
+            with self.subTest(url=url, viewer='reader'):
+                self.assertNotEqual(etag, before[url])
+        Post.objects.create(
+            author=self.author, group=self.group, text='Новый пост'
+        )
+        after_post = self.etags()
+        for url in self.urls[:3]:
+            with self.subTest(url=url, change='post'):
+                self.assertNotEqual(after_post[url], before[url])
+        self.comment.delete()
+        url = self.urls[3]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=after_post[url])
+            .status_code, 200
+        )
+
+
+class StaleWhileRevalidateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.version = 1
+        self.renders = []
+
+        def view(request):
+            self.renders.append(self.version)
+            time.sleep(0.3)
+            return HttpResponse(f'Версия {self.version}')
+
+        self.view = cache_view(version=lambda request: self.version)(view)
+        self.factory = RequestFactory()
+
+    def concurrent_states(self, count=3):
+        states = []
+
+        def get():
+            states.append(self.view(self.factory.get('/page/'))['X-Cache'])
+
+        threads = [threading.Thread(target=get) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(states)
+
+    def test_one_request_renders_missing_page(self):
+        """Пустой кэш заполняет один запрос, остальные ждут его."""
+        self.assertEqual(self.concurrent_states(), ['HIT', 'HIT', 'MISS'])
+        self.assertEqual(self.renders, [1])
+
+    def test_stale_page_is_served_while_one_request_renders(self):
+        """Устаревшую страницу пересчитывает один запрос."""
+        self.view(self.factory.get('/page/'))
+        self.version = 2
+        self.assertEqual(
+            self.concurrent_states(), ['MISS', 'STALE', 'STALE']
+        )
+        self.assertEqual(self.renders, [1, 2])
+        response = self.view(self.factory.get('/page/'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.content.decode(), 'Версия 2')
+
+    def test_page_may_expire_early(self):
+        """Незадолго до срока страница может пересчитаться заранее."""
+        page = CachedPage(HttpResponse(), 1, time.time() + 1, delta=1)
+        with mock.patch('posts.caching.random.random', return_value=0.0):
+            self.assertTrue(page.is_fresh(1))
+        with mock.patch('posts.caching.random.random', return_value=0.99):
+            self.assertFalse(page.is_fresh(1))
+        self.assertFalse(page.is_fresh(2))
+
+    def test_group_page_is_cached_until_it_changes(self):
+        """Страница группы кэшируется и пересчитывается после поста."""
+        url = reverse('posts:group_list', args=[self.group.slug])
+        self.assertEqual(self.client.get(url)['X-Feed-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Feed-Cache'], 'HIT')
+        Post.objects.create(
+            author=self.author, group=self.group, text='Новый пост'
+        )
+        response = self.client.get(url)
+        self.assertEqual(response['X-Feed-Cache'], 'MISS')
+        self.assertContains(response, 'Новый пост')
+
+
+class HolePunchingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.reader = User.objects.create_user(username='StasBasov')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_page_is_shared_but_header_is_personal(self):
+        """Главная кэшируется одна на всех, шапка у каждого своя."""
+        url = reverse('posts:index')
+        response = self.author_client.get(url)
+        self.assertEqual(response['X-Feed-Cache'], 'MISS')
+        self.assertContains(response, 'Пользователь: Smirnov')
+        self.assertContains(response, 'Избранные авторы')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Feed-Cache'], 'HIT')
+        self.assertNotContains(response, 'Пользователь: Smirnov')
+        self.assertNotContains(response, 'Выйти')
+        self.assertNotContains(response, 'Избранные авторы')
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, '<!--hole:')
+
+    def test_profile_follow_button_is_filled_per_user(self):
+        """Кнопка подписки видна только чужому вошедшему пользователю."""
+        url = reverse('posts:profile', args=[self.author.username])
+        follow = reverse('posts:profile_follow', args=[self.author.username])
+        response = self.reader_client.get(url)
+        self.assertEqual(response['X-Feed-Cache'], 'MISS')
+        self.assertContains(response, follow)
+        for client in (self.author_client, self.client):
+            response = client.get(url)
+            self.assertEqual(response['X-Feed-Cache'], 'HIT')
+            self.assertNotContains(response, follow)
+
+    def test_post_detail_actions_and_comment_form(self):
+        """Правка — автору, форма комментария — вошедшим, из одной
+        страницы в кэше."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        edit = reverse('posts:post_edit', args=[self.post.pk])
+        comment = reverse('posts:add_comment', args=[self.post.pk])
+        self.assertEqual(self.client.get(url)['X-Feed-Cache'], 'MISS')
+        response = self.author_client.get(url)
+        self.assertEqual(response['X-Feed-Cache'], 'HIT')
+        self.assertContains(response, edit)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        response = self.reader_client.get(url)
+        self.assertNotContains(response, edit)
+        self.assertContains(response, comment)
+        response = self.client.get(url)
+        self.assertNotContains(response, comment)
+        self.assertEqual(response['Vary'], 'Cookie')
+
+
+class FollowFeedCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Smirnov')
+        cls.other = User.objects.create_user(username='Ivanov')
+        cls.follower = User.objects.create_user(username='StasBasov')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Тестовый пост {i}')
+            for i in range(5)
+        ]
+        Post.objects.create(author=cls.other, text='Пост другого автора')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        self.url = reverse('posts:follow_index')
+
+    def get_feed(self, query=''):
+        response = self.follower_client.get(self.url + query)
+        return list(response.context['page_obj'])
+
+    def test_cached_page_skips_timeline(self):
+        """Повторная страница ленты не читает ленту и посты из базы."""
+        self.get_feed()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_feed(), self.posts[::-1])
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('posts_timeline', tables)
+        self.assertNotIn('"posts_post"', tables)
+
+    def test_follow_and_unfollow_invalidate(self):
+        """Подписка и отписка сразу меняют ленту из кэша."""
+        self.get_feed()
+        self.follower_client.get(
+            reverse('posts:profile_follow', args=[self.other.username])
+        )
+        self.assertEqual(self.get_feed()[0].author, self.other)
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertEqual(
+            [post.author for post in self.get_feed()], [self.other]
+        )
+
+    def test_new_and_deleted_posts_invalidate(self):
+        """Новый и удалённый посты автора сразу видны в ленте из кэша."""
+        self.get_feed()
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.get_feed()[0], post)
+        post.delete()
+        self.assertEqual(self.get_feed(), self.posts[::-1])
+        Post.objects.create(author=self.other, text='Чужой пост')
+        self.assertIsNotNone(cache.get(follow_feed.feed_key(self.follower.pk)))
+
+    def test_new_post_reads_followers_once(self):
+        """Публикация читает подписчиков один раз: для ленты и кэша."""
+        self.get_feed()
+        with CaptureQueriesContext(connection) as queries:
+            Post.objects.create(author=self.author, text='Новый пост')
+        follower_queries = [
+            query for query in queries
+            if query['sql'].startswith('SELECT "posts_follow"."user_id"')
+        ]
+        self.assertEqual(len(follower_queries), 1)
+        self.assertIsNone(cache.get(follow_feed.feed_key(self.follower.pk)))
+
+    def test_author_rename_reaches_cached_posts(self):
+        """Новое имя автора видно в ленте из кэша объектов."""
+        self.get_feed()
+        self.author.first_name = 'Алексей'
+        self.author.save()
+        response = self.follower_client.get(self.url)
+        self.assertContains(response, 'Алексей')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_bumps_version(self):
+        """Пост популярного автора меняет его версию, а не ключи
+        подписчиков."""
+        self.get_feed()
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertIsNotNone(cache.get(follow_feed.feed_key(self.follower.pk)))
+        self.assertEqual(self.get_feed()[0], post)
+
+    @override_settings(SELECT_POSTS=2, FOLLOW_FEED_HEAD=3)
+    def test_pages_past_head_read_database(self):
+        """Страницы за началом ленты листаются без пропусков."""
+        timeline = list(Post.objects.filter(
+            timeline_entries__user=self.follower
+        ).order_by('-timeline_entries__pub_date', '-id'))
+        pages = [self.follower_client.get(self.url).context['page_obj']]
+        while pages[-1].has_next():
+            pages.append(self.follower_client.get(
+                f'{self.url}?after={pages[-1].next_cursor}'
+            ).context['page_obj'])
+        self.assertEqual(
+            [post for page_obj in pages for post in page_obj], timeline
+        )
+        self.assertEqual(self.get_feed('?page=3'), timeline[4:])
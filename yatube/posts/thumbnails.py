@@ -0,0 +1,169 @@
+"""
+Миниатюры картинок постов.
+
+Шаблоны не создают миниатюры во время запроса. После сохранения поста
+его картинка попадает в очередь ThumbnailTask, а команда
+process_thumbnails создаёт в пуле процессов все варианты миниатюры:
+каждую ширину из POST_THUMBNAIL_WIDTHS в каждом формате из
+POST_THUMBNAIL_FORMATS. Пока миниатюры нет, шаблон показывает заглушку.
+Готовые миниатюры страница находит разом для всех своих постов.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import ThumbnailTask
+
+
+def formats():
+    """Форматы миниатюр, которые умеют сохранять Pillow и sorl."""
+    Image.init()
+    return [
+        image_format for image_format in settings.POST_THUMBNAIL_FORMATS
+        if image_format in Image.SAVE and image_format in EXTENSIONS
+    ]
+
+
+def variants():
+    """Все варианты миниатюры: {(формат, ширина): (геометрия, опции)}."""
+    ratio_width, ratio_height = settings.POST_THUMBNAIL_RATIO
+    return {
+        (image_format, width): (
+            f'{width}x{round(width * ratio_height / ratio_width)}',
+            {'padding': True, 'upscale': True, 'format': image_format},
+        )
+        for image_format in formats()
+        for width in settings.POST_THUMBNAIL_WIDTHS
+    }
+
+
+def thumbnail_file(image, geometry, options):
+    """
+    ImageFile миниатюры с тем же именем, которое выберет get_thumbnail.
+    Вычисляется без чтения картинки и без запросов к хранилищу.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def fetch(keys):
+    """
+    Значения из хранилища sorl по ключам: одним get_many к его кэшу и
+    одним запросом к таблице для ключей, которых нет в кэше. Промахи в
+    кэш не пишутся: миниатюру делает другой процесс, и закэшированный
+    промах прятал бы её от страниц.
+    """
+    kv_cache = default.kvstore.cache
+    values = {
+        key: value for key, value in kv_cache.get_many(keys).items()
+        if isinstance(value, str)
+    }
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        kv_cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(found)
+    return values
+
+
+def prefetch_thumbnails(posts):
+    """
+    Проставляет постам thumbnails — словарь {(формат, ширина): миниатюра
+    или None} для всех вариантов. Миниатюры всех постов ищутся
+    разом; посты, у которых thumbnails уже есть, пропускаются.
+    """
+    posts = [post for post in posts if not hasattr(post, 'thumbnails')]
+    all_variants = variants()
+    wanted = {}
+    for post in posts:
+        if not post.image:
+            continue
+        for variant, (geometry, options) in all_variants.items():
+            file = thumbnail_file(post.image.name, geometry, options)
+            wanted[add_prefix(file.key)] = (post.image.name, variant)
+    found = {
+        wanted[key]: deserialize_image_file(value)
+        for key, value in (fetch(list(wanted)) if wanted else {}).items()
+    }
+    for post in posts:
+        post.thumbnails = {
+            variant: found.get((post.image.name, variant))
+            for variant in all_variants
+        } if post.image else {}
+
+
+def enqueue(*images):
+    ThumbnailTask.objects.bulk_create(
+        [ThumbnailTask(image=str(image)) for image in images if image],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def render_thumbnails(image):
+    """
+    Создаёт все миниатюры картинки. Выполняется в процессе пула,
+    возвращает текст ошибки или None.
+    """
+    try:
+        for geometry, options in variants().values():
+            get_thumbnail(image, geometry, **options)
+    except Exception as error:
+        return f'{type(error).__name__}: {error}'
+    return None
+
+
+def process(tasks, workers):
+    """
+    Обрабатывает задачи; при workers=0 — в текущем процессе.
+    Возвращает число картинок, для которых миниатюры готовы.
+    """
+    images = [task.image for task in tasks]
+    if workers:
+        # Дочерние процессы открывают свои соединения с базой.
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+            errors = list(pool.map(render_thumbnails, images))
+    else:
+        errors = [render_thumbnails(image) for image in images]
+    done = [task.pk for task, error in zip(tasks, errors) if error is None]
+    ThumbnailTask.objects.filter(pk__in=done).delete()
+    for task, error in zip(tasks, errors):
+        if error is not None:
+            ThumbnailTask.objects.filter(pk=task.pk).update(
+                attempts=F('attempts') + 1, error=error
+            )
+    return len(done)
+
+
+def pending_tasks(limit):
+    return list(
+        ThumbnailTask.objects.filter(
+            attempts__lt=settings.POST_THUMBNAIL_ATTEMPTS
+        ).order_by('pk')[:limit]
+    )
@@ -0,0 +1,221 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .models import Follow, Post, Timeline, UserStats
+
+
+def followers_count(author_id):
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def popular(prefix=''):
+    return (
+        Q(**{f'{prefix}followers_count__gt': settings.TIMELINE_FANOUT_LIMIT})
+        | Q(**{f'{prefix}backfill_pending': True})
+    )
+
+
+def is_popular(author_id):
+    """
+    Популярный автор — у кого больше TIMELINE_FANOUT_LIMIT подписчиков.
+    Его посты в ленты не раскладываются, лента читает их при запросе.
+    Автор, который перестал быть популярным, остаётся им, пока
+    trim_timelines не дозаполнит ленты его подписчиков.
+    """
+    return UserStats.objects.filter(popular(), user_id=author_id).exists()
+
+
+def popular_authors(user):
+    """id популярных авторов, на которых подписан пользователь."""
+    return list(Follow.objects.filter(
+        popular('author__stats__'), user=user
+    ).values_list('author_id', flat=True))
+
+
+def followers(author_id):
+    """
+    id подписчиков, в ленты которых раскладываются посты автора, или
+    None, если автор популярный.
+    """
+    if is_popular(author_id):
+        return None
+    return list(
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+    )
+
+
+def fan_out(post):
+    """
+    Раскладывает новый пост в ленты подписчиков автора. Посты популярных
+    авторов не раскладываются, иначе публикация держала бы запись в базе
+    на каждого подписчика. Возвращает то же, что followers().
+    """
+    user_ids = followers(post.author_id)
+    if user_ids:
+        Timeline.objects.bulk_create(
+            (
+                Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+                for user_id in user_ids
+            ),
+            batch_size=settings.TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    return user_ids
+
+
+def feed(user, popular=None):
+    """
+    Лента подписок пользователя: посты с датой и id записи в feed_date и
+    feed_id и запрос пар (дата, id) в порядке ленты для её начала и
+    подсчёта. Если пользователь подписан на популярных авторов, их посты
+    читаются из таблицы постов вместе с лентой.
+    """
+    if popular is None:
+        popular = popular_authors(user)
+    if not popular:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_id=F('timeline_entries__post_id'),
+        )
+        entries = user.timeline.order_by('-pub_date', '-post_id')
+        return posts, entries.values_list('pub_date', 'post_id')
+    posts = Post.objects.filter(
+        Q(pk__in=user.timeline.values('post_id'))
+        | Q(author_id__in=popular)
+    ).annotate(feed_date=F('pub_date'), feed_id=F('pk'))
+    entries = posts.order_by('-pub_date', '-pk')
+    return posts, entries.values_list('pub_date', 'pk')
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    posts = (
+        follow.author.posts.order_by('-pub_date', '-id')
+        .values_list('id', 'pub_date')[:settings.TIMELINE_LENGTH]
+    )
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=follow.user_id, post_id=post_id,
+                     pub_date=pub_date)
+            for post_id, pub_date in posts
+        ),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(follow.user_id)
+
+
+def bulk_backfill(first_user_id):
+    """
+    Заполняет ленты пользователей с id не меньше first_user_id одним
+    INSERT ... SELECT, оставляя каждому TIMELINE_LENGTH последних постов.
+    Предполагает, что лент у этих пользователей ещё нет.
+    """
+    sql = (
+        'INSERT INTO {timeline} (user_id, post_id, pub_date) '
+        'SELECT user_id, post_id, pub_date FROM ('
+        'SELECT f.user_id AS user_id, p.id AS post_id, '
+        'p.pub_date AS pub_date, ROW_NUMBER() OVER ('
+        'PARTITION BY f.user_id ORDER BY p.pub_date DESC, p.id DESC'
+        ') AS position '
+        'FROM {follow} f INNER JOIN {post} p ON p.author_id = f.author_id '
+        'WHERE f.user_id >= %s'
+        ') entries WHERE position <= %s'
+    ).format(
+        timeline=connection.ops.quote_name(Timeline._meta.db_table),
+        follow=connection.ops.quote_name(Follow._meta.db_table),
+        post=connection.ops.quote_name(Post._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [first_user_id, settings.TIMELINE_LENGTH])
+        return cursor.rowcount
+
+
+def backfill_followers(author_id):
+    """
+    Добавляет последние посты автора в ленты всех его подписчиков, у
+    которых их нет: автор перестал быть популярным, и его посты снова
+    раскладываются, а опубликованные раньше должны остаться в лентах.
+    Длину лент потом выравнивает trim_timelines.
+    """
+    sql = (
+        'INSERT INTO {timeline} (user_id, post_id, pub_date) '
+        'SELECT f.user_id, p.id, p.pub_date FROM {follow} f '
+        'CROSS JOIN (SELECT id, pub_date FROM {post} WHERE author_id = %s '
+        'ORDER BY pub_date DESC, id DESC LIMIT %s) p '
+        'WHERE f.author_id = %s AND NOT EXISTS ('
+        'SELECT 1 FROM {timeline} t '
+        'WHERE t.user_id = f.user_id AND t.post_id = p.id)'
+    ).format(
+        timeline=connection.ops.quote_name(Timeline._meta.db_table),
+        follow=connection.ops.quote_name(Follow._meta.db_table),
+        post=connection.ops.quote_name(Post._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql, [author_id, settings.TIMELINE_LENGTH, author_id]
+        )
+        return cursor.rowcount
+
+
+def prune(follow):
+    """Убирает из ленты подписчика посты автора, от которого он отписался."""
+    Timeline.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+    # Автор перестал быть популярным. Дозаполнять ленты всех подписчиков
+    # внутри запроса долго, поэтому это делает trim_timelines, а до тех
+    # пор посты автора читаются при запросе.
+    UserStats.objects.filter(
+        user_id=follow.author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT,
+    ).update(backfill_pending=True)
+
+
+def backfill_pending():
+    """
+    Дозаполняет ленты подписчиков авторов, которые перестали быть
+    популярными, и снимает с них отметку. Если автор успел снова стать
+    популярным, дозаполнять нечего. Возвращает число таких авторов.
+    """
+    authors = list(
+        UserStats.objects.filter(backfill_pending=True)
+        .values_list('user_id', flat=True)
+    )
+    for author_id in authors:
+        with transaction.atomic():
+            count = UserStats.objects.select_for_update().filter(
+                user_id=author_id, backfill_pending=True
+            ).values_list('followers_count', flat=True).first()
+            if count is None:
+                continue
+            if count <= settings.TIMELINE_FANOUT_LIMIT:
+                backfill_followers(author_id)
+            UserStats.objects.filter(user_id=author_id).update(
+                backfill_pending=False
+            )
+    return len(authors)
+
+
+def trim(user_id, length=None):
+    """
+    Оставляет в ленте пользователя не больше length последних записей.
+    Возвращает число удалённых записей.
+    """
+    length = length or settings.TIMELINE_LENGTH
+    entries = Timeline.objects.filter(user_id=user_id)
+    boundary = (
+        entries.order_by('-pub_date', '-post_id')
+        .values_list('pub_date', 'post_id')[length:length + 1]
+    )
+    if not boundary:
+        return 0
+    pub_date, post_id = boundary[0]
+    deleted, _ = entries.filter(
+        Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, post_id__lte=post_id)
+    ).delete()
+    return deleted
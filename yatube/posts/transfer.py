@@ -0,0 +1,176 @@
+"""
+Выгрузка и загрузка контента в NDJSON.
+
+Каждая модель из CONTENT_MODELS пишется в свой файл <app.model>.ndjson,
+по объекту в строке — в том же виде, что и объекты фикстур Django:
+{"model": ..., "pk": ..., "fields": {...}}. Выгрузка идёт по
+возрастанию pk серверным курсором, поэтому память не растёт с объёмом.
+
+Загрузка вставляет строки bulk_create пачками, по транзакции на пачку,
+без сигналов. Ленты подписок, счётчики, поисковый индекс и очередь
+миниатюр после загрузки строятся заново разом. Прерванную выгрузку и
+загрузку можно продолжить с места остановки.
+"""
+import json
+import os
+from datetime import date, time
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from core.utils import batches
+
+from . import counters, follow_feed, search, thumbnails, timeline
+from .bulk import auto_date_fields, explicit_dates
+from .caching import bump_feed_generation
+from .models import (Comment, Follow, Group, Post, PostStats, Timeline, User,
+                     UserStats)
+
+CONTENT_MODELS = (User, Group, Post, Comment, Follow)
+STATE_FILE = 'import-state.json'
+TAIL_SIZE = 1024 * 1024
+
+
+def file_name(model):
+    return f'{model._meta.label_lower}.ndjson'
+
+
+def encode(value):
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def content_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def last_exported_pk(path):
+    """
+    pk последней целой строки файла. Недописанную строку в конце
+    файла, оставшуюся от прерванной выгрузки, обрезает.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        start = file.seek(max(size - TAIL_SIZE, 0))
+        tail = file.read()
+        complete = tail.rfind(b'\n') + 1
+        file.truncate(start + complete)
+    lines = tail[:complete].splitlines()
+    if not lines:
+        return None
+    return json.loads(lines[-1])['pk']
+
+
+def export_model(model, directory, batch_size=1000, resume=False):
+    """
+    Пишет объекты модели в её файл. С resume дописывает файл после
+    последнего выгруженного pk. Возвращает число записанных строк.
+    """
+    path = os.path.join(directory, file_name(model))
+    fields = content_fields(model)
+    rows = model.objects.order_by('pk').values_list(
+        'pk', *(field.attname for field in fields)
+    )
+    last_pk = last_exported_pk(path) if resume else None
+    if last_pk is not None:
+        rows = rows.filter(pk__gt=last_pk)
+    label = model._meta.label_lower
+    names = [field.name for field in fields]
+    written = 0
+    with open(path, 'a' if resume else 'w', encoding='utf-8') as file:
+        for pk, *values in rows.iterator(chunk_size=batch_size):
+            record = {'model': label, 'pk': pk, 'fields': dict(
+                zip(names, values)
+            )}
+            file.write(
+                json.dumps(record, ensure_ascii=False, default=encode) + '\n'
+            )
+            written += 1
+    return written
+
+
+def import_model(model, directory, batch_size=1000, offset=0,
+                 on_batch=None):
+    """
+    Вставляет объекты из файла модели, начиная с байта offset. После
+    каждой пачки вызывает on_batch(позиция в файле), чтобы прерванную
+    загрузку можно было продолжить. Строки с уже занятым pk
+    пропускаются: пачка могла вставиться, но не успеть отметиться.
+    Возвращает число прочитанных строк.
+    """
+    path = os.path.join(directory, file_name(model))
+    if not os.path.exists(path):
+        return 0
+    attnames = {field.name: field.attname for field in content_fields(model)}
+    read = 0
+    with open(path, 'rb') as file, explicit_dates(*auto_date_fields(model)):
+        file.seek(offset)
+        for lines in batches(file, batch_size):
+            objects = []
+            for line in lines:
+                record = json.loads(line)
+                objects.append(model(pk=record['pk'], **{
+                    attnames[name]: value
+                    for name, value in record['fields'].items()
+                }))
+            with transaction.atomic():
+                model.objects.bulk_create(objects, ignore_conflicts=True)
+            read += len(objects)
+            if on_batch:
+                on_batch(file.tell())
+    return read
+
+
+def load_state(directory):
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_state(directory, state):
+    """Пишет состояние через временный файл, чтобы не оставить половину."""
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+    os.replace(path + '.tmp', path)
+
+
+def clear_state(directory):
+    path = os.path.join(directory, STATE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def rebuild_derived(batch_size=1000):
+    """
+    Строит после загрузки то, что при обычном сохранении поддерживают
+    сигналы: последовательности id, ленты подписок, счётчики, поисковый
+    индекс и очередь миниатюр. Закэшированные ленты сбрасываются.
+    """
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), CONTENT_MODELS
+        ):
+            cursor.execute(sql)
+    with transaction.atomic():
+        Timeline.objects.all().delete()
+        timeline.bulk_backfill(0)
+    counters.repair(User, UserStats, counters.USER_COUNTERS, batch_size)
+    counters.repair(Post, PostStats, counters.POST_COUNTERS, batch_size)
+    search.rebuild_index(batch_size)
+    images = (
+        Post.objects.exclude(image='').values_list('image', flat=True)
+        .distinct().iterator(chunk_size=batch_size)
+    )
+    for batch in batches(images, batch_size):
+        thumbnails.enqueue(*batch)
+    bump_feed_generation()
+    follow_feed.invalidate_all()
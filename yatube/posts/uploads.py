@@ -0,0 +1,93 @@
+"""
+Приём картинок постов.
+
+Файлы пишутся на диск кусками стандартными обработчиками Django, а
+ImageSizeLimitHandler перед ними бросает файл, как только он вырастет
+больше UPLOAD_MAX_SIZE. Принятая картинка проверяется по числу
+пикселей до декодирования, поворачивается по EXIF, уменьшается до
+POST_IMAGE_MAX_SIDE и пересохраняется без метаданных.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image, ImageOps
+
+REJECTED_UPLOADS = 'rejected_uploads'
+
+
+class ImageSizeLimitHandler(FileUploadHandler):
+    """
+    Первый в FILE_UPLOAD_HANDLERS: пропускает куски файла дальше, пока
+    файл не превысит UPLOAD_MAX_SIZE, и бросает его, не дочитывая на
+    диск. Имена брошенных полей запоминаются в запросе.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            rejected_uploads(self.request).add(self.field_name)
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def rejected_uploads(request):
+    """Поля запроса, файлы которых не приняты из-за размера."""
+    if not hasattr(request, REJECTED_UPLOADS):
+        setattr(request, REJECTED_UPLOADS, set())
+    return getattr(request, REJECTED_UPLOADS)
+
+
+def check_pixels(image):
+    """
+    image — картинка, которую открыл ImageField: Pillow прочитал только
+    заголовок, поэтому размер известен до декодирования.
+    """
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большая картинка: %(width)s×%(height)s пикселей.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+
+
+def normalize_image(upload):
+    """
+    Пересохраняет загруженную картинку: поворот по EXIF, уменьшение до
+    POST_IMAGE_MAX_SIDE, JPEG (PNG для картинок с прозрачностью) без
+    EXIF и других метаданных. Возвращает ContentFile с новым именем.
+    """
+    upload.seek(0)
+    side = settings.POST_IMAGE_MAX_SIDE
+    with Image.open(upload) as image:
+        # JPEG умеет декодироваться сразу в уменьшенном масштабе.
+        image.draft('RGB', (side, side))
+        image = ImageOps.exif_transpose(image)
+        transparent = image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info
+        )
+        image = image.convert('RGBA' if transparent else 'RGB')
+        image.thumbnail((side, side), Image.LANCZOS)
+        buffer = BytesIO()
+        if transparent:
+            image.save(buffer, 'PNG', optimize=True)
+            extension = 'png'
+        else:
+            image.save(
+                buffer, 'JPEG', quality=settings.POST_IMAGE_QUALITY,
+                optimize=True, progressive=True,
+            )
+            extension = 'jpg'
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(buffer.getvalue(), name=f'{name}.{extension}')
@@ -32,6 +32,14 @@ urlpatterns = [
         'posts/<int:post_id>/comment/',
         views.add_comment, name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments, name='post_comments'
+    ),
+    path(
+        'search/',
+        views.search, name='search'
+    ),
     path(
         'follow/',
         views.follow_index, name='follow_index'
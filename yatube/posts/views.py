@@ -1,15 +1,24 @@
-from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
-from django.views.decorators.cache import cache_page
+from django.db import transaction
+from django.views.decorators.http import condition
 
 
 from .models import Post, Group, User, Follow
+from .caching import (cache_feed, feed_generation, group_etag,
+                      group_versions, index_etag, post_etag, post_versions,
+                      profile_etag, profile_versions)
+from . import follow_feed, timeline
+from .counters import post_stats, user_stats
 from .forms import PostForm, CommentForm
+from .paginators import CursorPaginator
+from .uploads import rejected_uploads
+from .search import search_posts
 
 
-@cache_page(settings.CACHE_TIME)
+@condition(etag_func=index_etag)
+@cache_feed
 def index(request):
     post_list = Post.objects.select_related('author', 'group').all()
     page_obj = paginator(post_list, request)
@@ -17,10 +26,14 @@ def index(request):
     context = {
         'page_obj': page_obj,
         'title': title,
+        'feed_generation': feed_generation(),
+        'index': True,
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=group_etag)
+@cache_feed(version=group_versions)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_list = group.posts.select_related().all()
@@ -34,41 +47,58 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=profile_etag)
+@cache_feed(version=profile_versions)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
     post_list = author.posts.select_related('group').all()
     page_obj = paginator(post_list, request)
-    count = author.posts.count()
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(author=author, user=request.user).exists()
-    )
+    stats = user_stats(author)
     context = {
         'page_obj': page_obj,
-        'count': count,
+        'count': stats.posts_count,
+        'stats': stats,
         'author': author,
-        'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=post_etag)
+@cache_feed(version=post_versions)
 def post_detail(request, post_id):
-    post_detail = get_object_or_404(Post, id=post_id)
-    count = post_detail.author.posts.count()
-    form = CommentForm(request.POST or None)
-    comments = post_detail.comments.all()
+    post_detail = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group', 'stats'),
+        id=post_id
+    )
+    count = user_stats(post_detail.author).posts_count
+    comments = comments_paginator(post_detail, request)
     context = {
         'count': count,
+        'comments_count': post_stats(post_detail).comments_count,
         'post_detail': post_detail,
-        'form': form,
         'comments': comments
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    post = get_object_or_404(Post, id=post_id)
+    context = {
+        'post_detail': post,
+        'comments': comments_paginator(post, request),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(
+        request.POST or None, files=request.FILES or None,
+        rejected_uploads=rejected_uploads(request),
+    )
     if form.is_valid():
         username = request.user.username
         post = form.save(commit=False)
@@ -83,7 +113,8 @@ def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None, instance=post
+        files=request.FILES or None, instance=post,
+        rejected_uploads=rejected_uploads(request),
     )
     context = {
         'form': form,
@@ -100,6 +131,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -111,35 +143,51 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = search_posts(query, after=request.GET.get('after'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'title': f'Поиск: {query}' if query else 'Поиск',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def follow_index(request):
-    author_list = Follow.objects.filter(user=request.user).values('author')
-    post_list = (
-        Post.objects.filter
-        (author__in=author_list).select_related('author', 'group')
-    )
-    page_obj = paginator(post_list, request)
+    page_obj = follow_feed.page(request.user, request.GET)
+    if page_obj is None:
+        page_obj = follow_page(request)
     title = 'Список постов авторов'
     context = {
         'page_obj': page_obj,
         'title': title,
+        'follow': True,
     }
     return render(request, 'posts/follow.html', context)
 
 
+def follow_page(request):
+    """Страница ленты подписок из базы, если её нет в кэше."""
+    post_list, entries = timeline.feed(request.user)
+    return paginator(
+        post_list.select_related('author', 'group'), request,
+        date_field='feed_date', pk_field='feed_id', count_list=entries
+    )
+
+
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    follower = author.following.all().values_list('user', flat=True)
-    if request.user.id not in follower and author != request.user:
-        follow_new = Follow()
-        follow_new.user = request.user
-        follow_new.author = author
-        follow_new.save()
+    if author != request.user:
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     following = get_object_or_404(Follow, author=author, user=request.user)
@@ -147,8 +195,15 @@ def profile_unfollow(request, username):
     return redirect('posts:profile', username)
 
 
-def paginator(post_list, request):
-    paginator = Paginator(post_list, settings.SELECT_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def paginator(post_list, request, **kwargs):
+    paginator = CursorPaginator(post_list, settings.SELECT_POSTS, **kwargs)
+    page_obj = paginator.get_feed_page(request.GET)
     return page_obj
+
+
+def comments_paginator(post, request):
+    comment_list = post.comments.select_related('author')
+    paginator = CursorPaginator(
+        comment_list, settings.SELECT_COMMENTS, date_field='created'
+    )
+    return paginator.get_cursor_page(request.GET)
@@ -53,12 +53,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.ReplicaMiddleware',
+    'core.middleware.SingleFlightMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.HoleMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -91,9 +95,52 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Реплика только для чтения. Без REPLICA_DB она не используется;
+    # для проверки на одной машине подойдёт копия db.sqlite3.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'REPLICA_DB', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
+    },
 }
 
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+DATABASE_REPLICAS = ['replica'] if os.environ.get('REPLICA_DB') else []
+
+# Вьюхи, которые читают с реплик, и сколько секунд после записи
+# посетитель читает только основную базу.
+REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+)
+REPLICA_PIN_SECONDS = 10
+
+# Одновременные одинаковые анонимные GET-запросы к этим вьюхам в одном
+# процессе рендерятся один раз. Ключ — хост, путь с параметрами и
+# заголовки SINGLE_FLIGHT_KEY_HEADERS; cookie из
+# SINGLE_FLIGHT_IGNORED_COOKIES не мешают объединению. Ожидание дольше
+# SINGLE_FLIGHT_TIMEOUT секунд — и запрос рендерит страницу сам.
+SINGLE_FLIGHT_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:post_comments',
+)
+SINGLE_FLIGHT_KEY_HEADERS = ('HTTP_ACCEPT_ENCODING', 'HTTP_ACCEPT_LANGUAGE')
+SINGLE_FLIGHT_IGNORED_COOKIES = ()
+SINGLE_FLIGHT_TIMEOUT = 5
+
+# Счётчики статистики (core.metrics) копятся в памяти процесса и
+# сбрасываются в общий кэш не чаще раза в столько секунд.
+METRICS_FLUSH_INTERVAL = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -144,16 +191,112 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 SELECT_POSTS = 10
 
-CACHE_TIME = 20
+SELECT_COMMENTS = 20
+
+TIMELINE_LENGTH = 1000
+
+TIMELINE_BATCH_SIZE = 500
+
+# Посты авторов, у которых больше TIMELINE_FANOUT_LIMIT подписчиков, не
+# раскладываются в ленты при публикации, а читаются при запросе ленты.
+TIMELINE_FANOUT_LIMIT = 1000
+
+CACHE_TIME = 60 * 60 * 24
+
+# Устаревшую страницу пересчитывает один запрос, остальные ещё
+# CACHE_STALE_TIME получают старую; без записи ждут её до
+# CACHE_LOCK_TIMEOUT. CACHE_EARLY_BETA — насколько заранее страница
+# может пересчитаться до срока (0 — только по сроку).
+CACHE_STALE_TIME = 60 * 60
+CACHE_LOCK_TIMEOUT = 10
+CACHE_EARLY_BETA = 1.0
+
+CARD_CACHE_TIME = 60 * 60 * 24
+
+# Лента подписок: в кэше лежат первые FOLLOW_FEED_PAGES страниц. Посты
+# популярных авторов (больше TIMELINE_FANOUT_LIMIT подписчиков)
+# сбрасывают кэш сменой версии автора, а не перебором подписчиков.
+FOLLOW_FEED_PAGES = 3
+FOLLOW_FEED_HEAD = SELECT_POSTS * FOLLOW_FEED_PAGES
+
+# Миниатюры картинок постов для srcset: пропорции карточки, ширины и
+# форматы по убыванию предпочтения. Последний формат — запасной для
+# старых браузеров; форматы, которые Pillow не умеет сохранять,
+# пропускаются.
+POST_THUMBNAIL_RATIO = (960, 339)
+POST_THUMBNAIL_WIDTHS = (480, 960, 1440)
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+POST_THUMBNAIL_SIZES = '(max-width: 960px) 100vw, 960px'
+
+POST_THUMBNAIL_ATTEMPTS = 3
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загрузки больше мегабайта пишутся во временный файл кусками,
+# а больше UPLOAD_MAX_SIZE не дочитываются вовсе.
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.ImageSizeLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+UPLOAD_MAX_SIZE = 15 * 1024 * 1024
+
+# Картинки постов хранятся не больше POST_IMAGE_MAX_SIDE по большей
+# стороне; картинки больше POST_IMAGE_MAX_PIXELS не принимаются.
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_SIDE = 1920
+POST_IMAGE_QUALITY = 85
+
+
+# Общий кэш всех процессов сайта на машине: страницы, поколение ленты и
+# записи sorl видны каждому воркеру. Файл задаёт CACHE_DB; тесты
+# работают со своим файлом во временном каталоге (core.testing.TestRunner
+# и tests/conftest.py).
+CACHE_DB = os.environ.get('CACHE_DB', os.path.join(BASE_DIR, 'cache.sqlite3'))
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': CACHE_DB,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
 }
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Сколько SQL-запросов может выполнить страница (по имени URL).
+QUERY_BUDGETS = {
+    'posts:index': 5,
+    'posts:group_list': 6,
+    'posts:profile': 7,
+    'posts:post_detail': 6,
+    'posts:post_comments': 3,
+    'posts:search': 5,
+    'posts:follow_index': 6,
+    'posts:post_create': 15,
+    'posts:post_edit': 6,
+}
+
+QUERY_BUDGET_HEADERS = DEBUG
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}